@@ -0,0 +1,148 @@
+"""
+NumPy version of the base image preprocessing: the decoded pixels are turned
+into one array, darkened in place (by a table lookup before the resize when
+the image is resized) and the watermark is alpha blended into its center in
+place, with the same rounding as Image.paste. The result goes back to PIL
+for the text and the encoding. NumPy is optional, the Pillow path is used
+without it.
+"""
+from PIL import Image, ImageEnhance
+from base_loader import resize_base
+from metrics import stage
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# modes whose pixels map to a plain uint8 array, others go through the Pillow path
+ARRAY_MODES = ("L", "RGB", "RGBA")
+
+
+def numpy_available() -> bool:
+    return np is not None
+
+
+def brightness_table(factor: float) -> "np.ndarray":
+    """what ImageEnhance.Brightness makes of every 8 bit value, so the table rounds exactly like it"""
+    ramp = Image.frombytes("L", (256, 1), bytes(range(256)))
+    return np.asarray(ImageEnhance.Brightness(ramp).enhance(factor)).reshape(256)
+
+
+def fixed_point_multiplier(table: "np.ndarray") -> int | None:
+    """m with (value * m) >> 8 equal to the table for every value, if the table is such a scaling"""
+    values = np.arange(256, dtype=np.uint32)
+    for multiplier in range(258):
+        if np.array_equal((values * multiplier) >> 8, table):
+            return multiplier
+    return None
+
+
+class Brightness:
+    """
+    ImageEnhance.Brightness applied to uint8 pixels in place. A darkening
+    table is a fixed point multiplication, done a few rows at a time through
+    a small uint16 buffer, anything else is looked up in the table.
+    """
+    chunk_values = 1 << 16
+
+    def __init__(self, factor: float) -> None:
+        self.table = brightness_table(factor)
+        self.multiplier = fixed_point_multiplier(self.table)
+
+    def point_table(self, mode: str) -> list[int]:
+        """the table for Image.point of an image in mode, alpha stays as it is like ImageEnhance keeps it"""
+        table = self.table.tolist()
+        return table * 3 + list(range(256)) if mode == "RGBA" else table * len(mode)
+
+    def apply(self, pixels: "np.ndarray"):
+        if self.multiplier is None:
+            np.take(self.table, pixels, out=pixels, mode="clip")
+            return
+        rows = max(1, self.chunk_values // max(1, pixels[0].size))
+        buffer = np.empty((rows, *pixels.shape[1:]), dtype=np.uint16)
+        for top in range(0, pixels.shape[0], rows):
+            block = pixels[top:top + rows]
+            scaled = buffer[:len(block)]
+            np.multiply(block, self.multiplier, out=scaled, dtype=np.uint16)
+            scaled >>= 8
+            block[...] = scaled
+
+
+class ArrayWatermark:
+    """
+    the watermark as the two terms of its alpha blend, worked out once per run
+    for every mode it is blended into: the watermark premultiplied by its alpha
+    plus the rounding, and 255 - alpha to weight the image under it with
+    """
+
+    def __init__(self, watermark: Image.Image, brightness: float) -> None:
+        self.watermark = watermark
+        self.size = watermark.size
+        self.brightness = Brightness(brightness)
+        self.terms: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+
+    def blend_terms(self, mode: str) -> tuple["np.ndarray", "np.ndarray"]:
+        if mode not in self.terms:
+            if "A" in self.watermark.getbands():
+                alpha = np.asarray(self.watermark.getchannel("A"), dtype=np.uint16)
+            else:
+                alpha = np.full(self.size[::-1], 255, dtype=np.uint16)
+            # paste converts the watermark to the mode of the image first
+            colour = np.asarray(self.watermark.convert(mode), dtype=np.uint16)
+            if colour.ndim == 2:
+                colour = colour[..., None]
+            alpha = alpha[..., None]
+            self.terms[mode] = (colour * alpha + 128, 255 - alpha)
+        return self.terms[mode]
+
+    def blend_into(self, pixels: "np.ndarray", mode: str):
+        """pastes the watermark in the center of pixels, clipped to them like Image.paste does"""
+        height, width = pixels.shape[:2]
+        left, top = width // 2 - self.size[0] // 2, height // 2 - self.size[1] // 2
+        x0, y0 = max(left, 0), max(top, 0)
+        x1, y1 = min(left + self.size[0], width), min(top + self.size[1], height)
+        if x0 >= x1 or y0 >= y1:
+            return
+        premultiplied, inverse_alpha = self.blend_terms(mode)
+        crop = (slice(y0 - top, y1 - top), slice(x0 - left, x1 - left))
+        region = pixels[y0:y1, x0:x1]
+        # (region * (255 - alpha) + colour * alpha) / 255, rounded the way pillow's DIV255 does
+        blended = np.multiply(region, inverse_alpha[crop], dtype=np.uint16)
+        blended += premultiplied[crop]
+        blended += blended >> 8
+        np.right_shift(blended, 8, out=region, casting="unsafe")
+
+
+def image_array(image_file: Image.Image) -> "np.ndarray":
+    """a writable (height, width, bands) copy of the pixels"""
+    pixels = np.array(image_file)
+    return pixels[..., None] if pixels.ndim == 2 else pixels
+
+
+def preprocess_array(image_file: Image.Image, watermark: ArrayWatermark,
+                     image_size: tuple[int, int] | None) -> Image.Image:
+    """
+    the base image darkened and watermarked like preprocess_base does it, the
+    same to the last bit. An image to be resized is darkened by a table
+    lookup before it, the resize clips what it overshoots past white, after
+    it the clipped values would be darkened too. Otherwise it is darkened
+    in place in the array the watermark is blended into.
+    """
+    mode = image_file.mode
+    if image_size and image_file.size != tuple(image_size):
+        with stage("enhance"):
+            image_file = image_file.point(watermark.brightness.point_table(mode))
+        with stage("resize"):
+            image_file = resize_base(image_file, image_size)
+        pixels = image_array(image_file)
+        del image_file
+    else:
+        with stage("enhance"):
+            pixels = image_array(image_file)
+            del image_file
+            # alpha stays as it is, like ImageEnhance keeps it
+            watermark.brightness.apply(pixels[..., :3] if mode == "RGBA" else pixels)
+    with stage("watermark"):
+        watermark.blend_into(pixels, mode)
+    return Image.fromarray(pixels[..., 0] if mode == "L" else pixels)
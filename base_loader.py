@@ -0,0 +1,33 @@
+"""
+Decoding of the base images. When the run has an image_size a JPEG is
+decoded straight at a smaller scale with draft mode, libjpeg then skips most
+of the work of a large camera photo, and the rest of the way to image_size is
+done by a high quality resample.
+"""
+from PIL import Image
+
+
+# the final resize, after draft mode it is mostly a scale down by less than 2
+RESAMPLE = Image.Resampling.LANCZOS
+# formats without draft mode are first reduced by whole factors while they stay
+# at least this many times image_size, the result looks the same as without
+REDUCING_GAP = 3.0
+
+
+def open_base(image_path: str, image_size: tuple[int, int] | None) -> Image.Image:
+    """
+    the decoded image. For a JPEG bigger than image_size, at the smallest of
+    1/2, 1/4 and 1/8 of its size that still covers image_size.
+    """
+    image_file = Image.open(image_path)
+    if image_size:
+        # only the header has been read yet, other formats ignore it
+        image_file.draft(None, image_size)
+    image_file.load()
+    return image_file
+
+
+def resize_base(image_file: Image.Image, image_size: tuple[int, int] | None) -> Image.Image:
+    if not image_size or image_file.size == tuple(image_size):
+        return image_file
+    return image_file.resize(image_size, RESAMPLE, reducing_gap=REDUCING_GAP)
@@ -0,0 +1,37 @@
+"""
+Uploads the same image N times through WpApi against the fake WordPress server
+and reports how many TCP connections were needed, from both ends.
+
+    python -m benchmarks.bench_connections -n 200
+"""
+import argparse
+import time
+
+from benchmarks.fake_wordpress import FakeWordpress
+from wordpressapi.media_api import MediaData
+from wordpressapi.wp_api import WpApi
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=100, help="number of uploads")
+    parser.add_argument("--size", type=int, default=200_000, help="payload size in bytes")
+    args = parser.parse_args()
+
+    payload = b"\0" * args.size
+    with FakeWordpress() as fake:
+        wpapi = WpApi(fake.url, "user", "pass")
+        start = time.perf_counter()
+        for i in range(args.n):
+            wpapi.media.create_media(MediaData(payload, f"image_{i}.png", f"image_{i}.png"))
+        elapsed = time.perf_counter() - start
+        client = wpapi.connection_stats()
+        wpapi.close()
+
+    print(f"uploads: {args.n} in {elapsed:.2f}s ({args.n / elapsed:.1f}/s)")
+    print(f"requests sent: {client['requests']}, server saw {fake.requests}")
+    print(f"connections opened: {client['connections']}, server accepted {fake.connections}")
+
+
+if __name__ == "__main__":
+    main()
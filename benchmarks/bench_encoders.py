@@ -0,0 +1,52 @@
+"""
+Encodes sample images in every output format pillow can write here and
+reports the bytes and encode time of each, with and without a size target.
+Without --images it uses Capture.PNG and synthetic photo-like images.
+
+    python -m benchmarks.bench_encoders [--images folder] [--max-kb 300]
+"""
+import argparse
+import os
+import time
+
+from PIL import Image
+
+from benchmarks.synthetic import synthetic_photo
+from encoders import ENCODERS, OutputEncoding, available_formats, encode
+from gallery_renderer import BASE_DIR
+from image_uploader import get_file
+
+
+def sample_images(folder: str | None) -> list[tuple[str, Image.Image]]:
+    if folder:
+        paths = get_file(folder, [".png", ".jpg", ".jpeg"])
+    else:
+        paths = [os.path.join(BASE_DIR, "Capture.PNG")]
+    samples = [(os.path.basename(path), Image.open(path).convert("RGB")) for path in paths]
+    if not folder:
+        samples += [(f"synthetic_{i}", synthetic_photo((1200, 800), i)) for i in range(3)]
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", help="folder of sample images")
+    parser.add_argument("--max-kb", type=int, default=60, help="size target for the second pass")
+    args = parser.parse_args()
+
+    samples = sample_images(args.images)
+    print(f"{len(samples)} images: {', '.join(name for name, _ in samples)}")
+    print(f"{'format':<8} {'target':>8} {'total KB':>10} {'ms/image':>10}")
+    for output_format in available_formats():
+        # a size target only changes the lossy formats
+        for max_kb in (None, args.max_kb) if ENCODERS[output_format].lossy else (None,):
+            encoding = OutputEncoding(output_format, max_bytes=max_kb * 1024 if max_kb else None)
+            start = time.perf_counter()
+            total = sum(len(encode(image, encoding)) for _, image in samples)
+            elapsed = (time.perf_counter() - start) / len(samples)
+            print(f"{output_format.value:<8} {f'{max_kb}KB' if max_kb else '-':>8} {total / 1024:>10.0f} "
+                  f"{elapsed * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
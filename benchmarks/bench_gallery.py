@@ -0,0 +1,61 @@
+"""
+Renders galleries of growing size with the gallery template, as one string
+and streamed piece by piece, to check that time and memory grow linearly with
+the number of images. Also times compiling the template cold and from the
+bytecode cache.
+
+    python -m benchmarks.bench_gallery --sizes 1000 10000 50000
+"""
+import argparse
+import time
+import tracemalloc
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+from gallery_renderer import DEFAULT_TEMPLATE, TEMPLATE_DIR, gallery_template, render_gallery
+
+
+def compile_time(bytecode_cache) -> float:
+    start = time.perf_counter()
+    Environment(loader=FileSystemLoader(TEMPLATE_DIR), bytecode_cache=bytecode_cache).get_template(DEFAULT_TEMPLATE)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000], help="images per gallery")
+    args = parser.parse_args()
+
+    bytecode_cache = FileSystemBytecodeCache()
+    compile_time(bytecode_cache)  # fills the cache
+    print(f"compile: {compile_time(None) * 1000:.1f} ms cold, {compile_time(bytecode_cache) * 1000:.1f} ms from bytecode")
+
+    template = gallery_template()
+    for size in args.sizes:
+        images = [(f"quote_{i}.png", f"/wp-content/uploads/2024/01/quote_{i}.png") for i in range(size)]
+
+        start = time.perf_counter()
+        html = template.render(images=images, render_style=True)
+        render_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        streamed = sum(len(piece) for piece in render_gallery(template, images, True))
+        stream_seconds = time.perf_counter() - start
+
+        tracemalloc.start()
+        template.render(images=images, render_style=True)
+        render_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        for _ in render_gallery(template, images, True):
+            pass
+        stream_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        assert streamed == len(html)
+        print(f"{size:>6} images: render {render_seconds * 1000:7.1f} ms {render_peak / 1024 ** 2:6.1f} MB peak, "
+              f"streamed {stream_seconds * 1000:7.1f} ms {stream_peak / 1024 ** 2:6.1f} MB peak, "
+              f"{render_seconds / size * 1e6:.2f} us per image")
+
+
+if __name__ == "__main__":
+    main()
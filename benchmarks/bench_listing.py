@@ -0,0 +1,51 @@
+"""
+Lists the pages of a large fake site with the old single request, with
+sequential pagination, with parallel pagination, and again with a warm
+listing cache that only revalidates.
+
+    python -m benchmarks.bench_listing --pages 3000 --latency 0.05
+"""
+import argparse
+import tempfile
+import time
+
+from benchmarks.fake_wordpress import FakeWordpress
+from wordpressapi.listing import list_collection
+from wordpressapi.wp_api import WpApi
+
+
+def timed(label: str, fn) -> list:
+    start = time.perf_counter()
+    result = fn()
+    print(f"{label:<28} {len(result):>6} items in {time.perf_counter() - start:.2f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=3000, help="number of wordpress pages on the site")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the server waits per request")
+    args = parser.parse_args()
+
+    with FakeWordpress(latency=args.latency) as fake, tempfile.TemporaryDirectory() as cache_dir:
+        for i in range(args.pages):
+            fake.add_page(f"Page {i}", "<p>" + "lorem ipsum " * 200 + "</p>")
+        wpapi = WpApi(fake.url, "user", "pass")
+        url = fake.url + "/wp-json/wp/v2/pages"
+        auth = ("user", "pass")
+
+        timed("single request (old)", lambda: wpapi.session.get(url, auth=auth).json())
+        timed("sequential, all fields", lambda: list_collection(wpapi.session, url, auth, 30, max_workers=1))
+        timed("parallel, all fields", lambda: list_collection(wpapi.session, url, auth, 30))
+        timed("parallel, id and title", lambda: list_collection(wpapi.session, url, auth, 30, ["id", "title"]))
+
+        cached = WpApi(fake.url, "user", "pass", listing_cache_dir=cache_dir)
+        timed("list_pages, cold cache", lambda: cached.page.list_pages())
+        timed("list_pages, revalidated", lambda: cached.page.list_pages())
+        fake.add_page("Added later")
+        pages = timed("list_pages, after a change", lambda: cached.page.list_pages())
+        assert "Added later" in pages
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Loads large JPEG bases at a run's image_size three ways: decoded in full and
+resized bicubic like earlier versions, decoded in full and resized with the
+final resample, and decoded in draft mode by base_loader. Reports the time
+per image and the peak memory of each, every way in a fresh process, and how
+close the other two come to the full decode with the final resample in PSNR.
+
+    python -m benchmarks.bench_loader [--bases 3] [--source 6000x4000] [--size 1200x800] [--images folder]
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from base_loader import RESAMPLE, open_base, resize_base
+from benchmarks.bench_preprocess import parse_size, peak_rss_mb, reset_peak_rss
+from benchmarks.synthetic import synthetic_photo
+from image_uploader import get_file
+
+
+def load_full_bicubic(image_path: str, image_size: tuple[int, int]) -> Image.Image:
+    image_file = Image.open(image_path)
+    image_file.load()
+    return image_file.resize(image_size)
+
+
+def load_full(image_path: str, image_size: tuple[int, int]) -> Image.Image:
+    image_file = Image.open(image_path)
+    image_file.load()
+    return image_file.resize(image_size, RESAMPLE)
+
+
+def load_draft(image_path: str, image_size: tuple[int, int]) -> Image.Image:
+    return resize_base(open_base(image_path, image_size), image_size)
+
+
+LOADERS = {"full bicubic": load_full_bicubic, "full": load_full, "draft": load_draft}
+
+
+def run_loader(name: str, paths: list[str], image_size: tuple[int, int],
+               output_folder: str) -> tuple[float, float, float]:
+    """seconds per image, memory in use before and the peak after, the results go to output_folder to be compared"""
+    load = LOADERS[name]
+    before = reset_peak_rss()
+    start = time.perf_counter()
+    for path in paths:
+        image_file = load(path, image_size)
+        del image_file
+    seconds = (time.perf_counter() - start) / len(paths)
+    after = peak_rss_mb()
+    for i, path in enumerate(paths):
+        load(path, image_size).save(os.path.join(output_folder, f"{i}.png"))
+    return seconds, before, after
+
+
+def psnr(expected: np.ndarray, actual: np.ndarray) -> float:
+    mse = float(np.mean((expected.astype(np.float64) - actual) ** 2))
+    return math.inf if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bases", type=int, default=3, help="synthetic jpeg bases")
+    parser.add_argument("--source", default="6000x4000", help="size of the synthetic bases, WIDTHxHEIGHT")
+    parser.add_argument("--size", default="1200x800", help="image_size of the run")
+    parser.add_argument("--images", help="folder of jpeg bases to use instead of synthetic ones")
+    args = parser.parse_args()
+    image_size = parse_size(args.size)
+    if not image_size:
+        parser.error("draft mode only applies with an image_size")
+
+    with tempfile.TemporaryDirectory() as folder:
+        if args.images:
+            paths = sorted(get_file(args.images, [".jpg", ".jpeg"]))
+        else:
+            paths = []
+            for i in range(args.bases):
+                paths.append(os.path.join(folder, f"base_{i}.jpg"))
+                synthetic_photo(parse_size(args.source), i).save(paths[-1], quality=90)
+        results = {}
+        for name in LOADERS:
+            output_folder = os.path.join(folder, name)
+            os.makedirs(output_folder)
+            # a fresh process per loader, the peak memory of one is not hidden by the other
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                results[name] = pool.submit(run_loader, name, paths, image_size, output_folder).result()
+
+        quality = {name: 0.0 for name in LOADERS}
+        for i in range(len(paths)):
+            reference = np.asarray(Image.open(os.path.join(folder, "full", f"{i}.png")))
+            for name in LOADERS:
+                quality[name] += psnr(reference, np.asarray(Image.open(os.path.join(folder, name, f"{i}.png")))) \
+                    / len(paths)
+
+    print(f"{len(paths)} images {'from ' + args.images if args.images else args.source}, image_size {args.size}")
+    print(f"{'loader':<14}{'ms/image':>10}{'peak MB':>10}{'growth MB':>11}{'PSNR dB':>10}")
+    for name, (seconds, before, after) in results.items():
+        print(f"{name:<14}{seconds * 1000:>10.1f}{after:>10.0f}{after - before:>11.0f}{quality[name]:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Compares media creation throughput of the single request multipart upload
+against the old two step flow (raw upload, then a POST for alt text/caption)
+on the fake WordPress server.
+
+    python -m benchmarks.bench_media_upload -n 300 --latency 0.02
+"""
+import argparse
+import time
+
+from benchmarks.fake_wordpress import FakeWordpress
+from wordpressapi.media_api import MediaData
+from wordpressapi.wp_api import WpApi
+
+
+def run(fake: FakeWordpress, n: int, payload: bytes, multipart: bool) -> float:
+    wpapi = WpApi(fake.url, "user", "pass")
+    wpapi.media.multipart_upload = multipart
+    requests_before = fake.requests
+    start = time.perf_counter()
+    for i in range(n):
+        created, _ = wpapi.media.create_media(MediaData(payload, f"image_{i}.png", f"alt {i}", f"caption {i}"))
+        assert created
+    elapsed = time.perf_counter() - start
+    wpapi.close()
+    mode = "single request" if multipart else "two step"
+    print(f"{mode:>15}: {n / elapsed:8.1f} uploads/s, {fake.requests - requests_before} requests")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=200, help="number of uploads per mode")
+    parser.add_argument("--size", type=int, default=200_000, help="payload size in bytes")
+    parser.add_argument("--latency", type=float, default=0.0, help="extra seconds the server waits per request")
+    args = parser.parse_args()
+
+    payload = b"\0" * args.size
+    with FakeWordpress(latency=args.latency) as fake:
+        two_step = run(fake, args.n, payload, multipart=False)
+        single = run(fake, args.n, payload, multipart=True)
+        item = fake.media[len(fake.media)]
+        assert item["alt_text"] == f"alt {args.n - 1}", item
+    print(f"speedup: {two_step / single:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Names N composites with few keywords using the list based loop that
+plan_jobs had and with NameGenerator, and reports time and name lengths.
+
+    python -m benchmarks.bench_naming --sizes 1000 5000 100000 --keywords 3
+"""
+import argparse
+import random
+import time
+
+from naming import NameGenerator, slug_key
+
+
+def list_names(n: int, prefix: str, keywords: list[str], seed: int) -> list[str]:
+    """the naming loop as it was, a list lookup per try and one more keyword per collision"""
+    rng = random.Random(seed)
+    occupied = []
+    for _ in range(n):
+        name = f"{prefix}_{rng.choice(keywords)}"
+        while name in occupied:
+            name += f"_{rng.choice(keywords)}"
+        occupied.append(name)
+    return occupied
+
+
+def report(label: str, n: int, fn):
+    start = time.perf_counter()
+    names = fn()
+    elapsed = time.perf_counter() - start
+    assert len({slug_key(name) for name in names}) == n, "duplicate names"
+    print(f"{label:<16} {n:>7} names in {elapsed:8.3f}s, longest {max(map(len, names))} chars")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 100000])
+    parser.add_argument("--keywords", type=int, default=3, help="number of keywords to pick from")
+    parser.add_argument("--list-limit", type=int, default=5000, help="largest size to run the list loop on")
+    args = parser.parse_args()
+
+    keywords = [f"keyword{i}" for i in range(args.keywords)]
+    for n in args.sizes:
+        if n <= args.list_limit:
+            report("list loop", n, lambda: list_names(n, "motivation", keywords, 0))
+        generator = NameGenerator("motivation", keywords, seed=0)
+        report("NameGenerator", n, lambda: [generator.next() for _ in range(n)])
+
+    first, again = NameGenerator("motivation", keywords, seed=7), NameGenerator("motivation", keywords, seed=7)
+    print(f"same seed, same names: {[first.next() for _ in range(1000)] == [again.next() for _ in range(1000)]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Runs the whole uploader against the fake wordpress server once per OutputFiles
+mode, writing the composites before uploading, writing them in the background
+and not writing them, and reports the time and files written of each.
+--write-delay adds a pause to every file write to stand in for a slow disk.
+
+    python -m benchmarks.bench_output_files [--bases 4] [--quotes 20] [--workers 4] [--write-delay 0.02]
+"""
+import argparse
+import builtins
+import os
+import tempfile
+import time
+
+from benchmarks.fake_wordpress import FakeWordpress
+from benchmarks.synthetic import write_job_assets
+from image_uploader import run_image_uploader
+from wordpressapi.wp_api import WpApi
+from wpdata_types import ImageVariance, LogoLocation, OutputFiles, OutputFormat, ScraperBotInput
+
+
+def slow_writes(delay: float):
+    """makes every open for writing pause first, in this process and in forked render processes"""
+    real_open = builtins.open
+
+    def open_slowly(file, mode="r", *args, **kwargs):
+        if "w" in mode:
+            time.sleep(delay)
+        return real_open(file, mode, *args, **kwargs)
+
+    builtins.open = open_slowly
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bases", type=int, default=4, help="base images")
+    parser.add_argument("--quotes", type=int, default=20, help="quotes, one composite per base and quote")
+    parser.add_argument("--workers", type=int, default=4, help="upload threads, 0 for the sequential mode")
+    parser.add_argument("--write-delay", type=float, default=0.0, help="seconds every file write takes extra")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        image_folder, logo_path, watermark_path = write_job_assets(folder, args.bases)
+        if args.write_delay:
+            slow_writes(args.write_delay)
+
+        rows = []
+        for output_files in OutputFiles:
+            output_folder = os.path.join(folder, f"out_{output_files.name}")
+            os.makedirs(output_folder)
+            with FakeWordpress() as fake:
+                page_id = fake.add_page("Gallery", '<div id="gallery"></div>')
+                bot_input = ScraperBotInput(
+                    wp_page_id=str(page_id), image_folder_path=image_folder, output_folder_path=output_folder,
+                    logo_file_path=logo_path, watermark_file_path=watermark_path,
+                    quotes=[f"quote number {i} for the benchmark" for i in range(args.quotes)],
+                    keywords=["bench"], image_size=(1200, 800), image_name="bench", element_id="gallery",
+                    wpapi=WpApi(fake.url, "user", "password"), logo_location=LogoLocation.BottomLeft,
+                    image_variance=ImageVariance.DifferentImage, img_count_attribute_name="data-count",
+                    upload_workers=args.workers or None, output_format=OutputFormat.JPEG,
+                    output_files=output_files, name_seed=0)
+                start = time.perf_counter()
+                run_image_uploader(bot_input)
+                elapsed = time.perf_counter() - start
+                rows.append((output_files.name, elapsed, len(fake.media), len(os.listdir(output_folder))))
+
+    # the uploader reports as it goes, the comparison comes after all of that
+    print(f"\n{args.bases * args.quotes} composites, {args.workers or 'sequential'} upload workers")
+    for row in rows:
+        print("{:<12} {:.2f}s  uploaded {}  written {}".format(*row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Preprocesses the same base images with the Pillow and the NumPy engine,
+decode, brightness, resize and watermark, and reports the time per image and
+the peak memory of each, every engine in a fresh process so their peaks do
+not mix. Growth is how far the peak went over the memory in use before. The NumPy results are compared to the Pillow ones pixel by pixel,
+the run fails when one differs by more than --tolerance levels.
+
+    python -m benchmarks.bench_preprocess [--bases 4] [--source 3000x2000] [--size 1200x800] [--tolerance 0]
+                                          [--images folder]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from array_preprocess import ArrayWatermark
+from benchmarks.synthetic import write_job_assets
+from image_uploader import BRIGHTNESS, get_file, preprocess_base
+from wpdata_types import PreprocessEngine
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def memory_status(field: str) -> float | None:
+    """VmRSS or VmHWM of this process in MB, None where there is no /proc"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss() -> float:
+    """restarts the peak memory count from the memory in use now, which it returns in MB"""
+    try:
+        # linux keeps ru_maxrss across exec, the peak of the parent would hide this process's own
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+    return memory_status("VmRSS") or peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = memory_status("VmHWM")
+    if peak is not None:
+        return peak
+    if resource is None:
+        return 0.0
+    unit = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 1024 ** 2
+
+
+def run_engine(engine: PreprocessEngine, paths: list[str], watermark_path: str, image_size: tuple[int, int] | None,
+               output_folder: str) -> tuple[float, float, float]:
+    """seconds per image, memory in use before and the peak after, the results go to output_folder to be compared"""
+    watermark = Image.open(watermark_path)
+    array_watermark = ArrayWatermark(watermark, BRIGHTNESS) if engine == PreprocessEngine.NumPy else None
+    before = reset_peak_rss()
+    start = time.perf_counter()
+    for path in paths:
+        image_file = preprocess_base(path, watermark, image_size, array_watermark)
+        del image_file
+    seconds = (time.perf_counter() - start) / len(paths)
+    after = peak_rss_mb()
+    # saved outside the timing, in a lossless format
+    for i, path in enumerate(paths):
+        preprocess_base(path, watermark, image_size, array_watermark).save(os.path.join(output_folder, f"{i}.png"))
+    return seconds, before, after
+
+
+def parse_size(value: str) -> tuple[int, int] | None:
+    width, height = (int(side) for side in value.lower().split("x"))
+    return (width, height) if width and height else None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bases", type=int, default=4, help="synthetic base images")
+    parser.add_argument("--source", default="3000x2000", help="size of the synthetic bases, WIDTHxHEIGHT")
+    parser.add_argument("--size", default="1200x800", help="image_size of the run, 0x0 keeps the source size")
+    parser.add_argument("--tolerance", type=int, default=0, help="levels a pixel may differ by between engines")
+    parser.add_argument("--images", help="folder of base images to use instead of synthetic ones")
+    args = parser.parse_args()
+    image_size = parse_size(args.size)
+
+    with tempfile.TemporaryDirectory() as folder:
+        image_folder, _, watermark_path = write_job_assets(folder, 0 if args.images else args.bases,
+                                                           parse_size(args.source))
+        paths = sorted(get_file(args.images or image_folder, [".png", ".jpg", ".jpeg"]))
+        results = {}
+        for engine in PreprocessEngine:
+            output_folder = os.path.join(folder, engine.name)
+            os.makedirs(output_folder)
+            # a fresh process per engine, the peak memory of one is not hidden by the other
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                results[engine] = pool.submit(run_engine, engine, paths, watermark_path, image_size,
+                                              output_folder).result()
+
+        worst, mean = 0, 0.0
+        for i in range(len(paths)):
+            expected = np.asarray(Image.open(os.path.join(folder, PreprocessEngine.Pillow.name, f"{i}.png")), np.int16)
+            actual = np.asarray(Image.open(os.path.join(folder, PreprocessEngine.NumPy.name, f"{i}.png")), np.int16)
+            difference = np.abs(expected - actual)
+            worst = max(worst, int(difference.max()))
+            mean += float(difference.mean()) / len(paths)
+
+    print(f"{len(paths)} images {'from ' + args.images if args.images else args.source}, image_size {args.size}")
+    print(f"{'engine':<8}{'ms/image':>10}{'peak MB':>10}{'growth MB':>11}")
+    for engine, (seconds, before, after) in results.items():
+        print(f"{engine.value:<8}{seconds * 1000:>10.1f}{after:>10.0f}{after - before:>11.0f}")
+    print(f"largest difference {worst} levels, mean {mean:.3f}")
+    if worst > args.tolerance:
+        print(f"the engines differ by more than {args.tolerance} levels")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
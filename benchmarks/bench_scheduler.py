@@ -0,0 +1,67 @@
+"""
+Uploads composites from a pool of threads to a fake wordpress server that
+answers 429 to the requests over --capacity in flight, once through a plain
+session and once through the site scheduler of WpApi, and reports how many
+uploads got through, the 429s the server sent and the time each took.
+
+    python -m benchmarks.bench_scheduler [--uploads 60] [--threads 12] [--capacity 3] [--latency 0.02]
+                                         [--rate 0] [--retry-after 0]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_wordpress import FakeWordpress
+from wordpressapi.media_api import MediaData, WordpressApiMediaCrud
+from wordpressapi.session import create_session
+from wordpressapi.wp_api import WpApi
+
+
+def upload_all(media: WordpressApiMediaCrud, uploads: int, threads: int, size: int) -> tuple[int, float]:
+    data = bytes(size)
+
+    def upload(i: int) -> bool:
+        created, _ = media.create_media(MediaData(data, f"bench_{i}.png", alt_text="bench"))
+        return created
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        created = sum(pool.map(upload, range(uploads)))
+    return created, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=60)
+    parser.add_argument("--threads", type=int, default=12, help="uploads sent at once")
+    parser.add_argument("--capacity", type=int, default=3, help="requests the server takes at once, 429 above")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the server takes per request")
+    parser.add_argument("--size", type=int, default=50_000, help="bytes per upload")
+    parser.add_argument("--rate", type=float, default=0.0, help="requests per second the scheduler sends, 0 for no cap")
+    parser.add_argument("--retry-after", default="0", help="Retry-After of the 429 answers")
+    args = parser.parse_args()
+
+    rows = []
+    for name in ("plain", "scheduled"):
+        with FakeWordpress(latency=args.latency, max_concurrent=args.capacity, retry_after=args.retry_after) as fake:
+            if name == "plain":
+                session = create_session(args.threads, status_forcelist=())
+                media = WordpressApiMediaCrud(fake.url, "user", "password", session)
+                scheduler = None
+            else:
+                wpapi = WpApi(fake.url, "user", "password", pool_size=args.threads, rate=args.rate or None)
+                media, session, scheduler = wpapi.media, wpapi.session, wpapi.scheduler
+            created, elapsed = upload_all(media, args.uploads, args.threads, args.size)
+            session.close()
+            rows.append((name, created, fake.throttled, scheduler.retries if scheduler else 0,
+                         f"{scheduler.limit:.1f}" if scheduler else "-", fake.peak_in_flight, elapsed))
+
+    # the clients report every failure as it happens, the comparison comes after all of that
+    print(f"\n{args.uploads} uploads from {args.threads} threads, server takes {args.capacity} at once")
+    print(f"{'client':<10}{'created':>8}{'429s':>6}{'retries':>8}{'limit':>7}{'peak':>6}{'seconds':>9}")
+    for row in rows:
+        print("{:<10}{:>8}{:>6}{:>8}{:>7}{:>6}{:>9.2f}".format(*row))
+
+
+if __name__ == "__main__":
+    main()
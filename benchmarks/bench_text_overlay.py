@@ -0,0 +1,54 @@
+"""
+Checks that pasting cached quote overlays gives exactly the pixels of drawing
+the quote with draw_text, and compares the time per composite of both.
+
+    python -m benchmarks.bench_text_overlay --bases 40 --quotes 10
+"""
+import argparse
+import random
+import sys
+import time
+
+from PIL import Image, ImageFont
+
+from image_uploader import draw_text
+from text_layout import paste_quote, quote_overlay
+
+WORDS = ("life is what happens when you are busy making other plans and the only way to do great "
+         "work is to love what you do stay hungry stay foolish quietly").split()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bases", type=int, default=20)
+    parser.add_argument("--quotes", type=int, default=10)
+    parser.add_argument("--size", type=int, nargs=2, default=(1200, 800))
+    parser.add_argument("--font", default="font.ttf")
+    parser.add_argument("--font-size", type=int, default=60)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    font = ImageFont.truetype(args.font, args.font_size)
+    size = tuple(args.size)
+    bases = [Image.merge("RGB", [Image.effect_noise(size, 40 + i)] * 3) for i in range(args.bases)]
+    quotes = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 40))) for _ in range(args.quotes)]
+
+    start = time.perf_counter()
+    drawn = [draw_text(base.copy(), quote, font) for quote in quotes for base in bases]
+    draw_time = time.perf_counter() - start
+
+    quote_overlay.cache_clear()
+    start = time.perf_counter()
+    pasted = [paste_quote(base.copy(), quote, font) for quote in quotes for base in bases]
+    paste_time = time.perf_counter() - start
+
+    mismatches = sum(a.tobytes() != b.tobytes() for a, b in zip(drawn, pasted))
+    total = len(drawn)
+    print(f"draw_text:   {draw_time / total * 1000:.2f} ms per composite")
+    print(f"paste_quote: {paste_time / total * 1000:.2f} ms per composite")
+    print(f"pixel mismatches: {mismatches} of {total}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
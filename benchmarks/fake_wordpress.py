@@ -0,0 +1,291 @@
+"""
+A small in-process stand-in for the WordPress REST API, enough of
+/wp-json/wp/v2/media and /wp-json/wp/v2/pages for the wordpressapi clients.
+It counts the TCP connections it accepts so connection reuse can be measured.
+Latency per request, bandwidth of bodies in both directions and a rate of
+503 errors can be set to stand in for a slow or flaky site, the errors come
+from a seeded generator so a run can be repeated. With max_concurrent the
+requests over that many in flight are answered 429, like a host that limits
+how many php workers a site gets.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+MEDIA_ITEM = re.compile(r"^/wp-json/wp/v2/media/(\d+)$")
+PAGE_ITEM = re.compile(r"^/wp-json/wp/v2/pages/(\d+)$")
+DISPOSITION_NAME = re.compile(rb'; name="([^"]*)"')
+DISPOSITION_FILENAME = re.compile(rb'; filename="([^"]*)"')
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, fake: "FakeWordpress"):
+        super().__init__(address, _Handler)
+        self.fake = fake
+
+    def process_request(self, request, client_address):
+        with self.fake.lock:
+            self.fake.connections += 1
+        super().process_request(request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, data, headers: dict[str, str] | None = None):
+        body = json.dumps(data).encode()
+        self.server.fake.transfer(len(body))
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_collection(self, items: list[dict], query: str):
+        """
+        one page of a collection, with the headers wordpress paginates by and
+        an ETag, answering 304 when the client already has that page
+        """
+        params = {name: values[0] for name, values in parse_qs(query).items()}
+        per_page = int(params.get("per_page", 10))
+        page = int(params.get("page", 1))
+        total = len(items)
+        total_pages = max(1, -(-total // per_page))
+        if page > total_pages:
+            return self._send_json(400, {"code": "rest_post_invalid_page_number"})
+        items = items[(page - 1) * per_page:page * per_page]
+        if "_fields" in params:
+            fields = params["_fields"].split(",")
+            items = [{name: item[name] for name in fields if name in item} for item in items]
+        body = json.dumps(items).encode()
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        not_modified = self.server.fake.etags and self.headers.get("If-None-Match") == etag
+        self.send_response(304 if not_modified else 200)
+        self.send_header("X-WP-Total", str(total))
+        self.send_header("X-WP-TotalPages", str(total_pages))
+        if self.server.fake.etags:
+            self.send_header("ETag", etag)
+        if not_modified:
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.server.fake.transfer(len(body))
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.fake.transfer(len(body))
+        return body
+
+    def _send_error(self, status: int = 503):
+        code = "too_many_requests" if status == 429 else "service_unavailable"
+        self._send_json(status, {"code": code}, {"Retry-After": self.server.fake.retry_after})
+
+    def _serve(self, handle, has_body: bool):
+        fake: FakeWordpress = self.server.fake
+        admitted = fake.enter()
+        try:
+            # the body is read either way, the connection is kept alive after an error
+            if not admitted:
+                if has_body:
+                    self._read_body()
+                return self._send_error(429)
+            accepted = fake.count_request()
+            body = self._read_body() if has_body else b""
+            if not accepted:
+                return self._send_error()
+            handle(fake, body)
+        finally:
+            fake.leave(admitted)
+
+    def do_GET(self):
+        self._serve(self._get, has_body=False)
+
+    def do_POST(self):
+        self._serve(self._post, has_body=True)
+
+    def _get(self, fake: "FakeWordpress", body: bytes):
+        path, _, query = self.path.partition("?")
+        if path == "/wp-json/wp/v2/media":
+            with fake.lock:
+                items = list(fake.media.values())
+            search = parse_qs(query).get("search")
+            if search:
+                items = [item for item in items if search[0].lower() in item["slug"]]
+            return self._send_collection(items, query)
+        if path == "/wp-json/wp/v2/pages":
+            with fake.lock:
+                items = [fake.page_json(pid) for pid in fake.pages]
+            return self._send_collection(items, query)
+        match = PAGE_ITEM.match(path)
+        if match and int(match.group(1)) in fake.pages:
+            return self._send_json(200, fake.page_json(int(match.group(1)), edit="context=edit" in query))
+        self._send_json(404, {"code": "rest_no_route"})
+
+    def _post(self, fake: "FakeWordpress", body: bytes):
+        path = self.path.split("?")[0]
+        if path == "/wp-json/wp/v2/media":
+            content_type = self.headers.get("Content-Type", "")
+            if content_type.startswith("multipart/form-data"):
+                if not fake.accept_multipart:
+                    return self._send_json(400, {"code": "rest_upload_no_data"})
+                file_name, data, fields = _parse_multipart(content_type, body)
+                item = fake.add_media(file_name, len(data))
+                fake.update_media(item, fields)
+                return self._send_json(201, item)
+            disposition = self.headers.get("Content-Disposition", "")
+            file_name = disposition.split("filename=")[-1].strip('"') or "file"
+            return self._send_json(201, fake.add_media(file_name, len(body)))
+        match = MEDIA_ITEM.match(path)
+        if match and int(match.group(1)) in fake.media:
+            item = fake.media[int(match.group(1))]
+            fake.update_media(item, json.loads(body or b"{}"))
+            return self._send_json(200, item)
+        match = PAGE_ITEM.match(path)
+        if match and int(match.group(1)) in fake.pages:
+            fake.pages[int(match.group(1))]["content"] = json.loads(body)["content"]
+            with fake.lock:
+                fake.page_updates += 1
+            return self._send_json(200, fake.page_json(int(match.group(1))))
+        self._send_json(404, {"code": "rest_no_route"})
+
+
+def _parse_multipart(content_type: str, body: bytes) -> tuple[str, bytes, dict]:
+    boundary = content_type.split("boundary=")[-1].strip('"').encode()
+    file_name, data, fields = "file", b"", {}
+    for part in body.split(b"--" + boundary)[1:-1]:
+        headers, _, value = part.partition(b"\r\n\r\n")
+        value = value[:-2]  # the CRLF before the next boundary
+        name = DISPOSITION_NAME.search(headers).group(1).decode()
+        if name == "file":
+            file_name, data = DISPOSITION_FILENAME.search(headers).group(1).decode(), value
+        else:
+            fields[name] = value.decode()
+    return file_name, data, fields
+
+
+class FakeWordpress:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, accept_multipart: bool = True,
+                 latency: float = 0.0, etags: bool = True, bandwidth: float | None = None,
+                 error_rate: float = 0.0, seed: int = 0, max_concurrent: int | None = None,
+                 retry_after: str = "0") -> None:
+        """
+        latency in seconds per request, bandwidth in bytes per second of every body sent or received,
+        retry_after is the Retry-After header of the 429 and 503 answers
+        """
+        self.accept_multipart = accept_multipart
+        self.etags = etags
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.max_concurrent = max_concurrent
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.throttled = 0
+        self.page_updates = 0
+        self.media: dict[int, dict] = {}
+        self.pages: dict[int, dict] = {1: {"title": "Gallery", "content": '<div id="gallery"></div>'}}
+        self._server = _Server((host, port), self)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def enter(self) -> bool:
+        """takes a request in, False if max_concurrent are in flight already and it is to be answered 429"""
+        with self.lock:
+            if self.max_concurrent and self.in_flight >= self.max_concurrent:
+                self.throttled += 1
+                return False
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return True
+
+    def leave(self, admitted: bool):
+        if admitted:
+            with self.lock:
+                self.in_flight -= 1
+
+    def count_request(self) -> bool:
+        """counts a request and waits out the latency, False if it is to fail with a 503"""
+        with self.lock:
+            self.requests += 1
+            failed = self.error_rate and self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return not failed
+
+    def transfer(self, size: int):
+        """waits as long as sending size bytes takes at the bandwidth"""
+        if self.bandwidth:
+            time.sleep(size / self.bandwidth)
+
+    def add_media(self, file_name: str, size: int) -> dict:
+        with self.lock:
+            media_id = len(self.media) + 1
+            slug = file_name.rsplit(".", 1)[0].lower()
+            item = {"id": media_id, "slug": slug, "alt_text": "", "caption": {"rendered": ""},
+                    "description": {"rendered": ""}, "title": {"rendered": slug}, "media_details": {"filesize": size},
+                    "guid": {"rendered": f"{self.url}/wp-content/uploads/{file_name}"}}
+            self.media[media_id] = item
+        return item
+
+    @staticmethod
+    def update_media(item: dict, fields: dict):
+        for name, value in fields.items():
+            # wordpress answers with the rendered html of these fields
+            item[name] = {"rendered": f"<p>{value}</p>\n"} if name in ("caption", "description") else value
+
+    def add_page(self, title: str, content: str = "") -> int:
+        with self.lock:
+            page_id = max(self.pages, default=0) + 1
+            self.pages[page_id] = {"title": title, "content": content}
+        return page_id
+
+    def page_json(self, page_id: int, edit: bool = False) -> dict:
+        page = self.pages[page_id]
+        content = {"rendered": page["content"]}
+        if edit:
+            content["raw"] = page["content"]
+        return {"id": page_id, "title": {"rendered": page["title"]}, "content": content}
+
+    def start(self) -> "FakeWordpress":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
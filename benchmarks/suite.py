@@ -0,0 +1,238 @@
+"""
+The benchmark suite. Generates synthetic backgrounds, quotes and a large page,
+runs the uploader end to end in every upload mode against the fake wordpress
+server, times update_content and the page listing, and saves the results of
+the current commit to benchmarks/results/<commit>.json. With --compare the
+results are checked against an earlier file, a metric that got worse by more
+than --threshold is reported as a regression.
+
+    python -m benchmarks.suite [--bases 4] [--quotes 6] [--size 800x540] [--latency 0.01] [--bandwidth-mb 20]
+                               [--error-rate 0.0] [--repeat 3] [--only e2e_pipelined,update_content]
+                               [--compare latest|<commit>|<path>] [--threshold 0.15] [--fail-on-regression]
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.fake_wordpress import FakeWordpress
+from benchmarks.synthetic import synthetic_page, synthetic_quotes, write_job_assets
+from gallery_renderer import gallery_template
+from image_uploader import run_image_uploader, update_content
+from wordpressapi.wp_api import WpApi
+from wpdata_types import ImageVariance, LogoLocation, ScraperBotInput
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+# stages of the end to end runs whose p50 is kept, the rest is in the run report
+TRACKED_STAGES = ("decode", "render", "encode", "upload", "update_content")
+E2E_MODES = {
+    "e2e_sequential": {},
+    "e2e_pipelined": {"upload_workers": 4},
+    "e2e_async": {"async_uploads": 8},
+}
+
+
+class Metric:
+    def __init__(self, value: float, higher_is_better: bool, unit: str = "") -> None:
+        self.value = value
+        self.higher_is_better = higher_is_better
+        self.unit = unit
+
+    def to_json(self) -> dict:
+        return {"value": self.value, "better": "higher" if self.higher_is_better else "lower", "unit": self.unit}
+
+
+def median_metrics(runs: list[dict[str, Metric]]) -> dict[str, Metric]:
+    """the median of every metric over the repeated runs of a scenario"""
+    first = runs[0]
+    return {name: Metric(statistics.median(run[name].value for run in runs if name in run),
+                         metric.higher_is_better, metric.unit)
+            for name, metric in first.items()}
+
+
+def e2e_run(args, assets: tuple[str, str, str], quotes: list[str], mode: dict) -> dict[str, Metric]:
+    image_folder, logo_path, watermark_path = assets
+    with tempfile.TemporaryDirectory() as folder, \
+            FakeWordpress(latency=args.latency, bandwidth=args.bandwidth_mb * 1024 ** 2 if args.bandwidth_mb else None,
+                          error_rate=args.error_rate, seed=args.seed) as fake:
+        page_id = fake.add_page("Gallery", '<div id="gallery"></div>')
+        metrics_path = os.path.join(folder, "metrics.json")
+        bot_input = ScraperBotInput(
+            wp_page_id=str(page_id), image_folder_path=image_folder, output_folder_path=folder,
+            logo_file_path=logo_path, watermark_file_path=watermark_path, quotes=quotes,
+            keywords=["bench", "suite"], image_size=(0, 0), image_name="bench", element_id="gallery",
+            wpapi=WpApi(fake.url, "user", "password"), logo_location=LogoLocation.BottomLeft,
+            image_variance=ImageVariance.DifferentImage, img_count_attribute_name="data-count",
+            name_seed=args.seed, metrics_path=metrics_path, **mode)
+        summary: dict = {}
+        # the uploader reports every image, only the numbers matter here
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run_image_uploader(bot_input, summary)
+            elapsed = time.perf_counter() - start
+        with open(metrics_path) as f:
+            report = json.load(f)
+    results = {"images_per_second": Metric(summary["uploaded"] / elapsed, True, "images/s"),
+               "seconds": Metric(elapsed, False, "s"),
+               "failed": Metric(summary["failed"], False),
+               "megabytes_per_second": Metric(report["bytes_uploaded"] / 1024 ** 2 / elapsed, True, "MB/s")}
+    for stage in TRACKED_STAGES:
+        if stage in report["stages"]:
+            results[f"{stage}_p50_ms"] = Metric(report["stages"][stage]["p50"] * 1000, False, "ms")
+    return results
+
+
+def update_content_run(args) -> dict[str, Metric]:
+    template = gallery_template()
+    page = synthetic_page(5000, 5, args.seed)
+    images = [(f"quote_{i}.png", f"/wp-content/uploads/quote_{i}.png") for i in range(500)]
+    start = time.perf_counter()
+    update_content(template, page, "gallery", images, "data-count")
+    return {"seconds": Metric(time.perf_counter() - start, False, "s")}
+
+
+def list_pages_run(args) -> dict[str, Metric]:
+    with FakeWordpress(latency=args.latency, etags=False) as fake:
+        for i in range(1000):
+            fake.add_page(f"Page {i}", "<p>" + "lorem ipsum " * 50 + "</p>")
+        wpapi = WpApi(fake.url, "user", "password")
+        start = time.perf_counter()
+        pages = wpapi.page.list_pages()
+        elapsed = time.perf_counter() - start
+        wpapi.close()
+    return {"seconds": Metric(elapsed, False, "s"), "pages": Metric(len(pages), True)}
+
+
+def git_commit() -> tuple[str, bool]:
+    """short hash of HEAD and whether the tracked files differ from it"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                                    text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", True
+    return commit, dirty
+
+
+def find_baseline(compare: str, own_path: str) -> str | None:
+    """a results file, by path, by commit or the newest one other than this run's"""
+    if os.path.exists(compare):
+        return compare
+    if compare == "latest":
+        paths = [path for path in glob.glob(os.path.join(RESULTS_DIR, "*.json"))
+                 if os.path.abspath(path) != os.path.abspath(own_path)]
+        return max(paths, key=os.path.getmtime) if paths else None
+    for name in (f"{compare}.json", f"{compare}-dirty.json"):
+        path = os.path.join(RESULTS_DIR, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def compare_results(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """prints both runs side by side, returns the metrics that regressed"""
+    regressions = []
+    print(f"\ncompared with {baseline['commit']}{' (dirty)' if baseline.get('dirty') else ''}")
+    print(f"{'metric':<40}{'before':>12}{'now':>12}{'change':>10}")
+    for name, metric in current["results"].items():
+        before = baseline["results"].get(name)
+        if not before:
+            continue
+        if before["value"]:
+            change = (metric["value"] - before["value"]) / before["value"]
+            change_text = f"{change:+.1%}"
+        else:
+            # there is no relative change from 0, any move counts, like failed uploads going from 0 to some
+            change = math.copysign(math.inf, metric["value"]) if metric["value"] else 0.0
+            change_text = "from 0" if metric["value"] else f"{0:+.1%}"
+        worse = -change if metric["better"] == "higher" else change
+        flag = ""
+        if worse > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif worse < -threshold:
+            flag = "  improved"
+        print(f"{name:<40}{before['value']:>12.3f}{metric['value']:>12.3f}{change_text:>10}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bases", type=int, default=4, help="synthetic background images")
+    parser.add_argument("--quotes", type=int, default=6, help="quotes, one composite per background and quote")
+    parser.add_argument("--size", default="800x540", help="size of the backgrounds, WIDTHxHEIGHT")
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds the fake server waits per request")
+    parser.add_argument("--bandwidth-mb", type=float, default=0.0, help="MB/s of every body, 0 for unlimited")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 503")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario, the median is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", help="comma separated scenarios to run")
+    parser.add_argument("--output", help="results file, defaults to benchmarks/results/<commit>.json")
+    parser.add_argument("--compare", help="results to compare with: latest, a commit or a path")
+    parser.add_argument("--threshold", type=float, default=0.15, help="relative change counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with 1 when something regressed")
+    args = parser.parse_args()
+
+    commit, dirty = git_commit()
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}{'-dirty' if dirty else ''}.json")
+    quotes = synthetic_quotes(args.quotes, args.seed)
+    size = tuple(int(side) for side in args.size.lower().split("x"))
+
+    with tempfile.TemporaryDirectory() as folder:
+        assets = write_job_assets(folder, args.bases, size)
+        scenarios = {name: (lambda mode=mode: e2e_run(args, assets, quotes, mode)) for name, mode in E2E_MODES.items()}
+        scenarios["update_content"] = lambda: update_content_run(args)
+        scenarios["list_pages"] = lambda: list_pages_run(args)
+        if args.only:
+            selected = args.only.split(",")
+            unknown = set(selected) - set(scenarios)
+            if unknown:
+                parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+            scenarios = {name: scenarios[name] for name in selected}
+
+        results = {}
+        for name, scenario in scenarios.items():
+            metrics = median_metrics([scenario() for _ in range(args.repeat)])
+            for metric_name, metric in metrics.items():
+                results[f"{name}.{metric_name}"] = metric.to_json()
+                print(f"{name + '.' + metric_name:<40}{metric.value:>12.3f} {metric.unit}")
+
+    current = {"commit": commit, "dirty": dirty, "created_at": datetime.now(timezone.utc).isoformat(),
+               "python": sys.version.split()[0], "platform": platform.platform(),
+               "config": {name: value for name, value in vars(args).items()
+                          if name in ("bases", "quotes", "size", "latency", "bandwidth_mb", "error_rate", "repeat",
+                                      "seed")},
+               "results": results}
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(current, f, indent=2)
+    print(f"saved to {output}")
+
+    if args.compare:
+        baseline_path = find_baseline(args.compare, output)
+        if baseline_path is None:
+            print(f"no results found for {args.compare}")
+            return
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != current["config"]:
+            print(f"note: {baseline_path} was run with {baseline.get('config')}")
+        regressions = compare_results(baseline, current, args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
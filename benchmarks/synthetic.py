@@ -0,0 +1,59 @@
+"""
+Synthetic inputs for the benchmarks: photo-like background images, quotes,
+a logo and watermark, and large pages with gallery elements. Everything is
+generated from a seed so runs on different commits get the same data.
+"""
+import os
+import random
+
+from PIL import Image, ImageFilter
+
+
+WORDS = ("the", "light", "never", "always", "dream", "courage", "path", "small", "steps", "begin", "today",
+         "quiet", "mind", "strong", "heart", "grow", "every", "morning", "is", "a", "new", "chance", "to")
+
+
+def synthetic_photo(size: tuple[int, int], seed: int) -> Image.Image:
+    """smooth gradients with fine noise on top, which compresses about like a photo"""
+    noise = Image.effect_noise(size, 40 + seed * 5).convert("RGB")
+    gradient = Image.linear_gradient("L").resize(size).rotate(seed * 37, expand=False)
+    colored = Image.merge("RGB", (gradient, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+                                  gradient.transpose(Image.Transpose.FLIP_TOP_BOTTOM)))
+    return Image.blend(colored, noise.filter(ImageFilter.GaussianBlur(1)), 0.35)
+
+
+def synthetic_quotes(count: int, seed: int = 0, min_words: int = 6, max_words: int = 24) -> list[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))).capitalize()
+            for _ in range(count)]
+
+
+def write_job_assets(folder: str, bases: int, size: tuple[int, int] = (1200, 800)) -> tuple[str, str, str]:
+    """writes background images, a logo and a watermark into folder, returns the image folder and both files"""
+    image_folder = os.path.join(folder, "images")
+    os.makedirs(image_folder, exist_ok=True)
+    for i in range(bases):
+        synthetic_photo(size, i).save(os.path.join(image_folder, f"base_{i}.jpg"), quality=90)
+    logo_path = os.path.join(folder, "logo.png")
+    Image.new("RGBA", (200, 100), (255, 255, 255, 160)).save(logo_path)
+    watermark_path = os.path.join(folder, "watermark.png")
+    watermark = Image.new("RGBA", (size[0] // 3, size[1] // 6), (0, 0, 0, 0))
+    watermark.paste((255, 255, 255, 60), (0, 0, watermark.width, watermark.height // 2))
+    watermark.save(watermark_path)
+    return image_folder, logo_path, watermark_path
+
+
+def synthetic_page(blocks: int, targets: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts = ["<h2>Quotes</h2>\n<!-- wp:paragraph -->\n<p>Intro &amp; more<br>text</p>\n"]
+    target_every = max(1, blocks // targets)
+    for i in range(blocks):
+        if i % target_every == 0 and i // target_every < targets:
+            count = rng.choice(['', ' data-count="20"', ' data-count="x"'])
+            parts.append(f'<div id="gallery" class="wp-block"{count}><p>gallery {i}</p></div>\n')
+        parts.append(f'<div style="text-align: center;"><img src="/wp-content/uploads/old_{i}.png" '
+                     f'class="img-fluid" alt="old {i}"><a href="/wp-content/uploads/old_{i}.png" '
+                     f'class="buttondownload" download>Download</a></div>\n')
+        if i % 500 == 0:
+            parts.append("<script>if (a < b && c > d) { document.write('</p>'); }</script>\n")
+    return "".join(parts)
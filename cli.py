@@ -0,0 +1,195 @@
+"""
+Runs the image uploader from the command line with a json job spec, without
+the GUI. Prints a json summary as the last line of output.
+
+    python cli.py job.json [--summary-file summary.json]
+
+job.json:
+    {
+        "site": "https://example.com",          (a site url from credentials.csv, or
+                                                 "site_url", "username" and "app_password")
+        "wp_page_id": "12",
+        "image_folder_path": "images",
+        "output_folder_path": "output",
+        "logo_file_path": "logo.png",
+        "watermark_file_path": "watermark.png",
+        "quote_file": "quotes.txt",             (or "quotes": [...])
+        "keyword_file": "keywords.txt",         (or "keywords": [...])
+        "image_name": "motivation",
+        "element_id": "gallery",
+        "img_count_attribute_name": "data-count",
+        "image_size": [1200, 800],              optional, [0, 0] keeps the original size
+        "logo_location": "Bottom Left",         optional, a LogoLocation value or name
+        "image_variance": "Different Images Same Quote",  optional, an ImageVariance value or name
+        "content_mode": "Replace",              optional, a ContentMode value or name
+        "output_format": "WebP",                optional, PNG (default), JPEG, WebP or AVIF
+        "output_quality": 80,                   optional, quality of the lossy formats
+        "output_max_kb": 300,                   optional, size target of the lossy formats
+        "output_files": "Off",                  optional, an OutputFiles value or name, Sync by default
+        "preprocess_engine": "NumPy",           optional, Pillow (default) or NumPy
+        "metrics_path": "run_report.json",      optional, stage timings, bytes and http statuses of the run
+        "prometheus_path": "run_report.prom",   optional, the same report in the prometheus text format
+        "profile_path": "run.pstats",           optional, profiles the run with cProfile
+        "rate_limit": 5,                        optional, most requests per second sent to the site
+        "max_concurrency": 4,                   optional, most requests in flight to the site, fewer
+                                                 while it answers 429 or 503
+        ...                                     any other ScraperBotInput field
+    }
+
+To render once and upload to several sites at the same time, give "sites"
+instead of a single site and page:
+        "sites": [
+            {"site": "https://a.com", "wp_page_id": "12", "upload_workers": 4},
+            {"site_url": "https://b.com", "username": "...", "app_password": "...",
+             "wp_page_id": "7", "element_id": "other-gallery"}
+        ]
+"""
+import argparse
+import json
+import sys
+import time
+import traceback
+
+from fanout import run_fanout
+from image_uploader import run_image_uploader
+from wordpressapi.wp_api import WpApi, load_credentials
+from wpdata_types import ContentMode, ImageVariance, LogoLocation, OutputFiles, OutputFormat, PreprocessEngine, \
+    ScraperBotInput, SiteTarget
+
+
+csv_cred_file_path = "credentials.csv"
+
+
+class JobSpecError(Exception):
+    pass
+
+
+def read_lines(file_path: str) -> list[str]:
+    with open(file_path, 'r') as f:
+        return [line.strip("\n") for line in f.readlines()]
+
+
+def parse_enum(enum_type, value):
+    for member in enum_type:
+        if value in (member.value, member.name):
+            return member
+    raise JobSpecError(f"unknown {enum_type.__name__} '{value}'")
+
+
+def site_api(spec: dict, credentials_path: str) -> WpApi:
+    wpapi = find_site_api(spec, credentials_path)
+    wpapi.scheduler.configure(spec.pop("rate_limit", None), spec.pop("max_concurrency", None))
+    return wpapi
+
+
+def find_site_api(spec: dict, credentials_path: str) -> WpApi:
+    if "site_url" in spec:
+        if "username" not in spec or "app_password" not in spec:
+            raise JobSpecError("site_url needs username and app_password")
+        return WpApi(spec.pop("site_url"), spec.pop("username"), spec.pop("app_password"))
+    site = spec.pop("site", None)
+    websites_apis = load_credentials(credentials_path)
+    if site is None:
+        if not websites_apis:
+            raise JobSpecError(f"no credentials found in {credentials_path}")
+        return next(iter(websites_apis.values()))
+    if site not in websites_apis:
+        raise JobSpecError(f"site '{site}' not found in {credentials_path}")
+    return websites_apis[site]
+
+
+def build_site_targets(sites: list[dict], credentials_path: str) -> list[SiteTarget]:
+    targets = []
+    for site_spec in sites:
+        site_spec = dict(site_spec)
+        wpapi = site_api(site_spec, credentials_path)
+        if site_spec.get("wp_page_id") in (None, ""):
+            raise JobSpecError(f"missing wp_page_id for site {wpapi}")
+        site_spec["wp_page_id"] = str(site_spec["wp_page_id"])
+        unknown = set(site_spec) - set(SiteTarget._fields)
+        if unknown:
+            raise JobSpecError(f"unknown fields for site {wpapi}: {', '.join(sorted(unknown))}")
+        targets.append(SiteTarget(wpapi=wpapi, **site_spec))
+    return targets
+
+
+def build_bot_input(spec: dict, credentials_path: str, targets: list[SiteTarget] | None = None) -> ScraperBotInput:
+    spec = dict(spec)
+    if targets:
+        # the targets carry the sites and pages of a fan-out job
+        spec["wpapi"], spec["wp_page_id"] = targets[0].wpapi, targets[0].wp_page_id
+    else:
+        spec["wpapi"] = site_api(spec, credentials_path)
+    if "quote_file" in spec:
+        spec["quotes"] = read_lines(spec.pop("quote_file"))
+    if "keyword_file" in spec:
+        spec["keywords"] = read_lines(spec.pop("keyword_file"))
+    if not spec.get("quotes"):
+        raise JobSpecError("no quotes given")
+    if not spec.get("keywords"):
+        raise JobSpecError("no keywords given")
+
+    if spec.get("wp_page_id") in (None, ""):
+        # without it the whole job would be uploaded before the page update fails
+        raise JobSpecError("missing job spec fields: wp_page_id")
+    spec["wp_page_id"] = str(spec["wp_page_id"])
+    spec["image_size"] = tuple(spec.get("image_size", (0, 0)))
+    if spec.get("logo_size"):
+        spec["logo_size"] = tuple(spec["logo_size"])
+    spec["logo_location"] = parse_enum(LogoLocation, spec.get("logo_location", LogoLocation.BottomLeft.value))
+    spec["image_variance"] = parse_enum(ImageVariance, spec.get("image_variance", ImageVariance.DifferentImage.value))
+    spec["content_mode"] = parse_enum(ContentMode, spec.get("content_mode", ContentMode.Append.value))
+    spec["output_format"] = parse_enum(OutputFormat, spec.get("output_format", OutputFormat.PNG.value))
+    spec["output_files"] = parse_enum(OutputFiles, spec.get("output_files", OutputFiles.Sync.value))
+    spec["preprocess_engine"] = parse_enum(PreprocessEngine,
+                                           spec.get("preprocess_engine", PreprocessEngine.Pillow.value))
+
+    unknown = set(spec) - set(ScraperBotInput._fields)
+    if unknown:
+        raise JobSpecError(f"unknown job spec fields: {', '.join(sorted(unknown))}")
+    missing = [field for field in ScraperBotInput._fields
+               if field not in spec and field not in ScraperBotInput._field_defaults]
+    if missing:
+        raise JobSpecError(f"missing job spec fields: {', '.join(missing)}")
+    return ScraperBotInput(**spec)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Upload quote images to a wordpress page without the GUI")
+    parser.add_argument("job", help="path of the json job spec")
+    parser.add_argument("--credentials", default=csv_cred_file_path, help="credentials csv to look the site up in")
+    parser.add_argument("--summary-file", help="also write the json summary to this file")
+    args = parser.parse_args(argv)
+
+    start_time = time.perf_counter()
+    summary: dict = {"job": args.job, "success": False}
+    try:
+        with open(args.job) as f:
+            spec = json.load(f)
+        if "sites" in spec:
+            targets = build_site_targets(spec.pop("sites"), args.credentials)
+            bot_input = build_bot_input(spec, args.credentials, targets)
+            summary["sites"] = run_fanout(bot_input, targets)
+            summary["success"] = all(report["page_updated"] for report in summary["sites"].values())
+        else:
+            bot_input = build_bot_input(spec, args.credentials)
+            summary["site"] = str(bot_input.wpapi)
+            summary["success"] = run_image_uploader(bot_input, summary)
+    except (JobSpecError, OSError, ValueError) as e:
+        summary["error"] = str(e)
+    except Exception as e:
+        # anything else is a bug or an answer the site should not give, the summary line is still printed
+        traceback.print_exc()
+        summary["error"] = f"{type(e).__name__}: {e}"
+    summary["seconds"] = round(time.perf_counter() - start_time, 2)
+
+    output = json.dumps(summary)
+    if args.summary_file:
+        with open(args.summary_file, "w") as f:
+            f.write(output)
+    print(output)
+    return 0 if summary["success"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import NamedTuple
+
+from wordpressapi.listing import ListingError
+from wordpressapi.media_api import MediaOutput
+from wordpressapi.wp_api import WpApi
+
+
+MARKER_PREFIX = "wpiu-sha256:"
+MARKER = re.compile(MARKER_PREFIX + r"([0-9a-f]{64})")
+
+
+class DedupEntry(NamedTuple):
+    site: str
+    sha256: str
+    media_id: int | str | None
+    slug: str
+    link: str  # full guid link, as create_media returns it
+    title: str
+
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def dedup_marker(digest: str) -> str:
+    """goes in the media description so the index can be rebuilt from the site"""
+    return MARKER_PREFIX + digest
+
+
+class DedupIndex:
+    """
+    local jsonl store of which composites, by content hash, are already in the
+    media library of each site. A site is synced from its media library the
+    first time it is used, or again when asked to rebuild or when its last sync
+    is older than max_age, and every upload is added to it as it finishes. A
+    sync rewrites the file, so it holds one copy of every entry.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries: dict[tuple[str, str], DedupEntry] = {}
+        self.synced: dict[str, float] = {}  # site: time of its last sync
+        self.skipped = 0
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    if record.get("synced"):
+                        # everything listed before a rebuild of the site is stale
+                        site = record["site"]
+                        self.entries = {key: entry for key, entry in self.entries.items() if key[0] != site}
+                        self.synced[site] = record.get("at", 0.0)
+                        continue
+                    entry = DedupEntry(**record)
+                except (ValueError, TypeError, KeyError):
+                    continue
+                self.entries[(entry.site, entry.sha256)] = entry
+
+    def _write(self, records: list[dict]):
+        lines = "".join(json.dumps(record) + "\n" for record in records)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite(self):
+        """replaces the file with the sync record of every site and its entries, nothing of the file is lost on a crash"""
+        records = [{"site": site, "synced": True, "at": at} for site, at in self.synced.items()]
+        records += [entry._asdict() for entry in self.entries.values()]
+        folder = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=os.path.basename(self.path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write("".join(json.dumps(record) + "\n" for record in records))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def lookup(self, site: str, digest: str) -> MediaOutput | None:
+        with self.lock:
+            entry = self.entries.get((site, digest))
+            if entry:
+                self.skipped += 1
+        if not entry:
+            return None
+        return MediaOutput(id=entry.media_id, slug=entry.slug, link=entry.link, title=entry.title)
+
+    def add(self, site: str, digest: str, output: MediaOutput):
+        entry = DedupEntry(site, digest, output.id, output.slug, output.link, output.title)
+        with self.lock:
+            self.entries[(site, digest)] = entry
+            self._write([entry._asdict()])
+
+    def sync(self, wpapi: WpApi, rebuild: bool = False, max_age: float | None = None):
+        """reads the hash markers back from the media library of the site, max_age is in seconds"""
+        site = str(wpapi)
+        if site in self.synced and not rebuild:
+            if max_age is None or time.time() - self.synced[site] < max_age:
+                return
+        found = []
+        try:
+            media = wpapi.media.list_media(fields=["id", "slug", "guid", "title", "description"])
+            for item in media:
+                match = MARKER.search(item.get("description", {}).get("rendered", ""))
+                if match:
+                    found.append(DedupEntry(site, match.group(1), item["id"], item.get("slug", ""),
+                                            item["guid"]["rendered"], item.get("title", {}).get("rendered", "")))
+        except (ListingError, KeyError, TypeError, AttributeError) as e:
+            # a failed or unreadable listing is not an empty library, what the index has is kept as it is
+            print(f"{site}: dedup index not synced, {e!r}")
+            return
+        with self.lock:
+            self.entries = {key: entry for key, entry in self.entries.items() if key[0] != site}
+            self.entries.update({(site, entry.sha256): entry for entry in found})
+            self.synced[site] = time.time()
+            self._rewrite()
+        print(f"{site}: {len(found)} of {len(media)} media items are earlier composites")
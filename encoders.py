@@ -0,0 +1,126 @@
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+from PIL import Image, features
+from wpdata_types import OutputFormat
+
+
+class Encoder(NamedTuple):
+    pillow_format: str
+    extension: str
+    content_type: str
+    lossy: bool
+    default_quality: int | None = None
+    feature: str | None = None  # pillow feature the format needs, if it is optional
+
+
+ENCODERS = {
+    OutputFormat.PNG: Encoder("PNG", ".png", "image/png", False),
+    OutputFormat.JPEG: Encoder("JPEG", ".jpg", "image/jpeg", True, 85),
+    OutputFormat.WebP: Encoder("WEBP", ".webp", "image/webp", True, 80, "webp"),
+    OutputFormat.AVIF: Encoder("AVIF", ".avif", "image/avif", True, 60, "avif"),
+}
+CONTENT_TYPES = {encoder.extension: encoder.content_type for encoder in ENCODERS.values()}
+CONTENT_TYPES[".jpeg"] = "image/jpeg"
+
+# a size target never pushes the quality below this
+MIN_QUALITY = 30
+
+
+class OutputEncoding(NamedTuple):
+    format: OutputFormat = OutputFormat.PNG
+    quality: int | None = None  # defaults to the format's default quality
+    max_bytes: int | None = None  # lossy formats lower the quality until the file fits
+
+
+def available_formats() -> list[OutputFormat]:
+    """formats the installed pillow can write"""
+    return [output_format for output_format, encoder in ENCODERS.items()
+            if encoder.feature is None or features.check(encoder.feature)]
+
+
+def content_type_for(file_name: str) -> str:
+    return CONTENT_TYPES.get(os.path.splitext(file_name)[1].lower(), "image/png")
+
+
+def save_options(encoder: Encoder, quality: int | None) -> dict:
+    if encoder.pillow_format == "JPEG":
+        return {"quality": quality, "optimize": True, "progressive": True}
+    if encoder.pillow_format == "WEBP":
+        return {"quality": quality, "method": 4}
+    if encoder.pillow_format == "AVIF":
+        return {"quality": quality, "speed": 6}
+    return {}  # png as image.save always wrote it
+
+
+def _encode(image: Image.Image, encoder: Encoder, quality: int | None) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=encoder.pillow_format, **save_options(encoder, quality))
+    return buffer.getvalue()
+
+
+def encode(image: Image.Image, encoding: OutputEncoding) -> bytes:
+    """
+    the image in the output format. With max_bytes the highest quality that
+    fits is searched for, down to MIN_QUALITY, the smallest result is returned
+    if even that does not fit.
+    """
+    encoder = ENCODERS[encoding.format]
+    if encoder.pillow_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    quality = encoding.quality or encoder.default_quality
+    data = _encode(image, encoder, quality)
+    if not encoder.lossy or not encoding.max_bytes or len(data) <= encoding.max_bytes:
+        return data
+
+    low, high = MIN_QUALITY, quality - 1
+    smallest = data
+    while low <= high:
+        middle = (low + high) // 2
+        candidate = _encode(image, encoder, middle)
+        if len(candidate) <= encoding.max_bytes:
+            data, low = candidate, middle + 1
+        else:
+            high = middle - 1
+        if len(candidate) < len(smallest):
+            smallest = candidate
+    return data if len(data) <= encoding.max_bytes else smallest
+
+
+def write_encoded(image: Image.Image, encoding: OutputEncoding, output_image_path: str) -> str:
+    with open(output_image_path, "wb") as f:
+        f.write(encode(image, encoding))
+    return output_image_path
+
+
+class OutputWriter:
+    """
+    writes encoded composites to the output folder from a background thread,
+    so uploads do not wait for the disk. At most max_pending composites wait
+    to be written, write blocks until one of them is.
+    """
+
+    def __init__(self, max_pending: int = 8) -> None:
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="output-writer")
+        self.failed = 0
+
+    def write(self, output_image_path: str, data: bytes):
+        self.pending.acquire()
+        self.pool.submit(self._write, output_image_path, data)
+
+    def _write(self, output_image_path: str, data: bytes):
+        try:
+            with open(output_image_path, "wb") as f:
+                f.write(data)
+        except OSError as e:
+            # the upload does not depend on the copy on disk
+            print(f"could not write {output_image_path}: {e}")
+            self.failed += 1
+        finally:
+            self.pending.release()
+
+    def close(self):
+        self.pool.shutdown(wait=True)
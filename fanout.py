@@ -0,0 +1,199 @@
+import os
+import queue
+import statistics
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from PIL import Image
+
+from dedup_index import DedupIndex
+from encoders import ENCODERS, OutputWriter
+from metrics import record_stages
+from image_uploader import (RenderJob, UploadResults, existing_media_slugs, get_file, init_render_worker,
+                            journal_progress, keep_output, load_base, measured_run, memory_budget_bytes,
+                            open_array_watermark, open_base_cache, open_dedup_index, output_encoding,
+                            peak_memory_report, plan_base_chunks, plan_jobs, publish_images, render_timed,
+                            resolve_sizes, upload_timed)
+from progress import report
+from upload_journal import JournalEntry, UploadJournal
+from wpdata_types import OutputFiles, ProgressKind, ScraperBotInput, SiteTarget
+
+
+class SiteUploads:
+    """upload state and timings of one site in a fan-out run"""
+
+    def __init__(self, target: SiteTarget, total_jobs: int, image_paths: list[str],
+                 journal: UploadJournal | None, finished: dict[int, JournalEntry],
+                 dedup: DedupIndex | None = None, progress: queue.SimpleQueue | None = None) -> None:
+        self.target = target
+        self.name = str(target.wpapi)
+        self.results = UploadResults(total_jobs, image_paths, self.name, journal, dedup, progress)
+        for index, entry in finished.items():
+            self.results.items[index] = (entry.file_name, entry.link)
+        self.latencies: list[float] = []
+        self.failed = 0
+        self.first_upload: float | None = None
+        self.last_upload: float | None = None
+        self.page_updated = False
+        self.lock = threading.Lock()
+        target.wpapi.allow_concurrency(target.upload_workers)
+        self.pool = ThreadPoolExecutor(max_workers=target.upload_workers,
+                                       thread_name_prefix=f"upload-{self.name}")
+
+    def upload(self, job: RenderJob, composite: str | bytes):
+        start = time.perf_counter()
+        try:
+            result = upload_timed(self.target.wpapi, composite, job, self.results)
+        except Exception:
+            # a site that goes down must not take the other sites with it
+            print(f"{self.name}: {job.file_name} failed\n{traceback.format_exc()}")
+            report(self.results.progress, ProgressKind.Failed, job.file_name)
+            result = None
+        end = time.perf_counter()
+        with self.lock:
+            self.latencies.append(end - start)
+            if result is None:
+                self.failed += 1
+            if self.first_upload is None:
+                self.first_upload = start
+            self.last_upload = end
+
+    def render_failed(self, job: RenderJob):
+        """a composite the site was waiting for could not be rendered"""
+        report(self.results.progress, ProgressKind.Failed, job.file_name)
+        with self.lock:
+            self.failed += 1
+
+    def report(self) -> dict:
+        uploaded = sum(1 for r in self.results.items if r)
+        elapsed = (self.last_upload - self.first_upload) if self.first_upload else 0.0
+        report = {"uploaded": uploaded, "failed": self.failed, "page_updated": self.page_updated,
+                  "seconds": round(elapsed, 2),
+                  "images_per_second": round(uploaded / elapsed, 2) if elapsed else 0.0}
+        if len(self.latencies) >= 2:
+            cuts = statistics.quantiles(self.latencies, n=100)
+            report["latency_p50"] = round(cuts[49], 3)
+            report["latency_p95"] = round(cuts[94], 3)
+        elif self.latencies:
+            report["latency_p50"] = report["latency_p95"] = round(self.latencies[0], 3)
+        return report
+
+
+def run_fanout(bot_input: ScraperBotInput, targets: list[SiteTarget]) -> dict[str, dict]:
+    """
+    renders the composites of bot_input once and uploads every one of them to
+    all the target sites at the same time, each site with its own upload pool,
+    then updates the page of every site. bot_input.wpapi and wp_page_id are
+    ignored, the targets give the sites and pages. Returns a report per site.
+    The run metrics cover every site, as with run_image_uploader.
+    With output_files Background or Off the encoded composites are kept in
+    memory until every site has uploaded them. Progress events count one
+    upload per site and composite.
+    """
+    with measured_run(bot_input, [target.wpapi for target in targets]):
+        return fan_out(bot_input, targets)
+
+
+def fan_out(bot_input: ScraperBotInput, targets: list[SiteTarget]) -> dict[str, dict]:
+    logo_size, font_size, image_size = resolve_sizes(bot_input)
+    images = get_file(bot_input.image_folder_path, [".png", ".jpg", ".jpeg"])
+
+    journal = UploadJournal(bot_input.journal_path) if bot_input.journal_path else None
+    progress = {str(target.wpapi): journal_progress(journal, str(target.wpapi), images, bot_input.quotes)
+                for target in targets}
+    fixed_names: dict[int, str] = {}
+    for finished in progress.values():
+        for index, entry in finished.items():
+            fixed_names.setdefault(index, entry.file_name)
+    existing_names = ()
+    if bot_input.avoid_existing_names:
+        existing_names = existing_media_slugs([target.wpapi for target in targets])
+    jobs = plan_jobs(bot_input.quotes, len(images), bot_input.image_name, bot_input.keywords, fixed_names,
+                     bot_input.name_seed, existing_names, ENCODERS[bot_input.output_format].extension)
+    dedup = open_dedup_index(bot_input, [target.wpapi for target in targets])
+    sites = [SiteUploads(target, len(jobs), images, journal, progress[str(target.wpapi)], dedup, bot_input.progress)
+             for target in targets]
+    # a composite is rendered again only if some site has not got it yet
+    remaining_jobs = [job for job in jobs if any(not site.results.uploaded(job) for site in sites)]
+    print(f"Rendering {len(remaining_jobs)} images once for {len(targets)} sites")
+    report(bot_input.progress, ProgressKind.Started,
+           count=sum(1 for job in remaining_jobs for site in sites if not site.results.uploaded(job)))
+    in_memory = bot_input.output_files != OutputFiles.Sync
+    writer = OutputWriter(bot_input.max_pending or 8) if bot_input.output_files == OutputFiles.Background else None
+
+    logo = Image.open(bot_input.logo_file_path).resize(logo_size)
+    watermark = Image.open(bot_input.watermark_file_path)
+    array_watermark = open_array_watermark(bot_input, watermark)
+    cache, watermark_digest = open_base_cache(bot_input)
+
+    def on_rendered(job: RenderJob, output_image_path: str, future: Future):
+        waiting = [site for site in sites if not site.results.uploaded(job)]
+        try:
+            composite, timings = future.result()
+        except Exception as e:
+            print(f"{job.file_name} failed to render: {e}")
+            for site in waiting:
+                site.render_failed(job)
+            return
+        record_stages(timings)
+        report(bot_input.progress, ProgressKind.Rendered, job.file_name, sum(timings.values()))
+        keep_output(writer, output_image_path, composite)
+        # a composite on disk costs every site only its path, one in memory is shared by them
+        for site in waiting:
+            site.pool.submit(site.upload, job, composite)
+
+    try:
+        for chunk in plan_base_chunks(images, image_size, memory_budget_bytes(bot_input, True)):
+            chunk_bases = set(chunk)
+            chunk_jobs = [job for job in remaining_jobs if job.base_index in chunk_bases]
+            if not chunk_jobs:
+                continue
+            processed_images = {base_index: load_base(images[base_index], watermark, image_size, cache,
+                                                      watermark_digest, array_watermark)
+                                for base_index in {job.base_index for job in chunk_jobs}}
+            render_pool = ProcessPoolExecutor(max_workers=bot_input.render_workers or os.cpu_count() or 1,
+                                              initializer=init_render_worker,
+                                              initargs=(processed_images, logo, bot_input.logo_location,
+                                                        bot_input.font_file, font_size,
+                                                        output_encoding(bot_input)))
+            try:
+                for job in chunk_jobs:
+                    output_image_path = os.path.join(bot_input.output_folder_path, job.file_name)
+                    future = render_pool.submit(render_timed, job, output_image_path, in_memory)
+                    future.add_done_callback(partial(on_rendered, job, output_image_path))
+            finally:
+                render_pool.shutdown(wait=True)
+            del processed_images
+    finally:
+        for site in sites:
+            site.pool.shutdown(wait=True)
+        if writer:
+            writer.close()
+    if writer and writer.failed:
+        print(f"{writer.failed} composites could not be written to {bot_input.output_folder_path}")
+    if dedup:
+        print(f"Dedup index: {dedup.skipped} uploads skipped")
+    print(peak_memory_report())
+
+    def publish(site: SiteUploads):
+        element_id = site.target.element_id or bot_input.element_id
+        try:
+            start = time.perf_counter()
+            site.page_updated = publish_images(bot_input, site.target.wpapi, site.target.wp_page_id,
+                                               element_id, site.results.items, len(images))
+            if site.page_updated:
+                report(bot_input.progress, ProgressKind.PageUpdated, seconds=time.perf_counter() - start)
+        except Exception:
+            print(f"{site.name}: page update failed\n{traceback.format_exc()}")
+
+    with ThreadPoolExecutor(max_workers=len(sites) or 1) as pool:
+        list(pool.map(publish, sites))
+
+    reports = {site.name: site.report() for site in sites}
+    for name, site_report in reports.items():
+        print(f"{name}: {site_report['uploaded']} uploaded, {site_report['failed']} failed, "
+              f"{site_report['images_per_second']} images/s, p50 {site_report.get('latency_p50', 0)}s, "
+              f"page updated: {site_report['page_updated']}")
+    return reports
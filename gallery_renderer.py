@@ -0,0 +1,35 @@
+import os
+import sys
+from functools import lru_cache
+from typing import Iterator
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
+
+
+# next to this file, or in the bundle's temp folder when frozen with pyinstaller
+BASE_DIR = getattr(sys, "_MEIPASS", os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_DIR = os.path.join(BASE_DIR, "templates")
+DEFAULT_TEMPLATE = "content_template.html"
+
+
+@lru_cache(maxsize=None)
+def gallery_template(template_file: str | None = None) -> Template:
+    """
+    the gallery template, the bundled one or the template file given. It is
+    compiled once per process, and the compiled code is kept in jinja's
+    bytecode cache so the next run does not compile it again.
+    """
+    if template_file:
+        template_dir, name = os.path.split(os.path.abspath(template_file))
+    else:
+        template_dir, name = TEMPLATE_DIR, DEFAULT_TEMPLATE
+    env = Environment(loader=FileSystemLoader(template_dir), bytecode_cache=FileSystemBytecodeCache(),
+                      auto_reload=False)
+    return env.get_template(name)
+
+
+def render_gallery(template: Template, images: list[tuple[str, str]], render_style: bool = False) -> Iterator[str]:
+    """
+    the gallery html of the images as it is rendered, piece by piece, so a large
+    gallery is never held as one string besides the page it goes into
+    """
+    return template.generate(images=images, render_style=render_style)
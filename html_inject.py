@@ -0,0 +1,187 @@
+import html as html_lib
+import re
+from itertools import chain
+from typing import Iterable, NamedTuple
+
+
+# elements that never have an end tag, so they are not kept on the open element stack
+VOID_ELEMENTS = frozenset(("area", "base", "br", "col", "embed", "hr", "img", "input",
+                           "link", "meta", "param", "source", "track", "wbr"))
+
+# start tags that end an element left open, as a browser reads them: tag to
+# (names it ends, names an open one is looked for no further than)
+IMPLIED_END = {
+    "li": (frozenset(("li",)), frozenset(("ul", "ol", "menu"))),
+    "dt": (frozenset(("dt", "dd")), frozenset(("dl",))),
+    "dd": (frozenset(("dt", "dd")), frozenset(("dl",))),
+    "option": (frozenset(("option",)), frozenset(("select", "datalist", "optgroup"))),
+    "optgroup": (frozenset(("option", "optgroup")), frozenset(("select", "datalist"))),
+    "tr": (frozenset(("tr",)), frozenset(("table", "thead", "tbody", "tfoot"))),
+    "td": (frozenset(("td", "th")), frozenset(("tr", "table"))),
+    "th": (frozenset(("td", "th")), frozenset(("tr", "table"))),
+    "thead": (frozenset(("thead", "tbody", "tfoot")), frozenset(("table",))),
+    "tbody": (frozenset(("thead", "tbody", "tfoot")), frozenset(("table",))),
+    "tfoot": (frozenset(("thead", "tbody", "tfoot")), frozenset(("table",))),
+}
+# block start tags that end an open <p>
+P_ENDING = frozenset(("address", "article", "aside", "blockquote", "dd", "details", "dialog", "div", "dl", "dt",
+                      "fieldset", "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6",
+                      "header", "hgroup", "hr", "li", "main", "menu", "nav", "ol", "p", "pre", "section", "table",
+                      "ul"))
+P_ENDED = frozenset(("p",))
+P_SCOPE = frozenset(("button", "table", "td", "th", "caption", "object", "template"))
+
+# a comment, a whole raw text element (its content is not markup), or a start or end tag
+TOKEN = re.compile(r"""<!--.*?-->
+                     |<(script|style|textarea)\b(?:"[^"]*"|'[^']*'|[^'">])*>.*?</\1\s*>
+                     |<(/?)([a-zA-Z][^\s/>]*)((?:"[^"]*"|'[^']*'|[^'">])*)>""",
+                   re.S | re.I | re.X)
+ATTRIBUTE = re.compile(r"""([^\s=/>]+)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s>]+))?""")
+
+# the images the uploader added to a target are kept between these, so a later
+# run can find and replace them. Not "wp:" comments, the block editor owns those.
+OWNED_BEGIN = "<!-- image-uploader -->"
+OWNED_END = "<!-- /image-uploader -->"
+
+
+def pieces(fragment: Iterable[str]) -> Iterable[str]:
+    """a fragment given as one string or as its pieces, as its pieces"""
+    return (fragment,) if isinstance(fragment, str) else fragment
+
+
+class TargetElement(NamedTuple):
+    start: int  # offset of the element's start tag
+    insert_at: int  # offset its new children go at, right before its end tag
+    count: int | None  # value of the count attribute, None if missing or not a number
+    self_closed: str | None = None  # tag name when written as <tag/>, insert_at is then the "/>"
+    owned: tuple[int, int] | None = None  # span of the uploader's marked block in the element
+
+    def insertion(self, fragment: Iterable[str]) -> tuple[int, int, Iterable[str]]:
+        """the span of the page to replace to append fragment to the element"""
+        if self.self_closed:
+            # <div id="x"/> becomes <div id="x">fragment</div>
+            return self.insert_at, self.insert_at + 2, chain((">",), pieces(fragment), (f"</{self.self_closed}>",))
+        return self.insert_at, self.insert_at, fragment
+
+    def owned_insertion(self, fragment: Iterable[str], replace: bool) -> tuple[int, int, Iterable[str]]:
+        """
+        the span to replace to put fragment in the element's marked block,
+        replacing what is in it or appending to it. The block is created at
+        the end of the element when it has none yet.
+        """
+        if not self.owned:
+            return self.insertion(chain((OWNED_BEGIN,), pieces(fragment), (OWNED_END,)))
+        start, end = self.owned
+        if replace:
+            return start, end, chain((OWNED_BEGIN,), pieces(fragment), (OWNED_END,))
+        end_marker = end - len(OWNED_END)
+        return end_marker, end_marker, fragment
+
+
+def parse_attributes(text: str) -> dict[str, str]:
+    attributes = {}
+    for name, value in ATTRIBUTE.findall(text):
+        if value[:1] in ("'", '"'):
+            value = value[1:-1]
+        # the first one wins, as in a browser
+        attributes.setdefault(name.lower(), html_lib.unescape(value))
+    return attributes
+
+
+def find_targets(html: str, element_id: str, count_attribute: str) -> list[TargetElement]:
+    """
+    elements with the id in document order, with where to append to each of
+    them and where their marked block is. One regex pass over the tags keeps only a stack of open tag names,
+    attributes are parsed only for tags that may carry the id.
+    """
+    count_attribute = count_attribute.lower()
+    stack: list[tuple[str, int | None]] = []  # tag name, index in targets if it is one
+    targets: list[dict] = []
+    owned_begin: dict[int, int] = {}  # target index to the offset of its open marker
+
+    def close(target_index: int | None, offset: int):
+        if target_index is not None:
+            targets[target_index]["insert_at"] = offset
+
+    def end_implied(ended: frozenset[str], scope: frozenset[str], offset: int):
+        """ends the innermost open element in ended, and everything open in it, unless a scope element comes first"""
+        for depth in range(len(stack) - 1, -1, -1):
+            name = stack[depth][0]
+            if name in ended:
+                while len(stack) > depth:
+                    close(stack.pop()[1], offset)
+                return
+            if name in scope:
+                return
+
+    for token in TOKEN.finditer(html):
+        closing, tag, attribute_text = token.group(2, 3, 4)
+        if tag is None:
+            # comment or raw text element, only the uploader's markers matter
+            if token.group() in (OWNED_BEGIN, OWNED_END):
+                target_index = next((index for _, index in reversed(stack) if index is not None), None)
+                if target_index is None or targets[target_index]["owned"]:
+                    continue
+                if token.group() == OWNED_BEGIN:
+                    owned_begin.setdefault(target_index, token.start())
+                elif target_index in owned_begin:
+                    targets[target_index]["owned"] = (owned_begin[target_index], token.end())
+            continue
+        tag = tag.lower()
+        if closing:
+            if not any(name == tag for name, _ in stack):
+                continue  # stray end tag
+            # elements left open inside this one end where it ends
+            while True:
+                name, target_index = stack.pop()
+                close(target_index, token.start())
+                if name == tag:
+                    break
+            continue
+
+        # <li>one<li>two: the first li ends where the second starts
+        if tag in IMPLIED_END:
+            end_implied(*IMPLIED_END[tag], token.start())
+        if tag in P_ENDING:
+            end_implied(P_ENDED, P_SCOPE, token.start())
+
+        target_index = None
+        if element_id in attribute_text or "&" in attribute_text:  # the id may be written with char refs
+            attributes = parse_attributes(attribute_text)
+            if attributes.get("id") == element_id:
+                try:
+                    count = int(attributes[count_attribute])
+                except (KeyError, ValueError):
+                    count = None
+                target_index = len(targets)
+                targets.append({"start": token.start(), "insert_at": None, "count": count, "owned": None})
+        if tag in VOID_ELEMENTS:
+            # children of an element that cannot have any go right after it
+            close(target_index, token.end())
+        elif attribute_text.endswith("/"):
+            # "<div/>" is taken as an empty element, as the lxml parser used before did
+            close(target_index, token.end() - 2)
+            if target_index is not None:
+                targets[target_index]["self_closed"] = tag
+        else:
+            stack.append((tag, target_index))
+
+    while stack:
+        _, target_index = stack.pop()
+        close(target_index, len(html))
+    return [TargetElement(**target) for target in targets]
+
+
+def splice(html: str, insertions: list[tuple[int, int, Iterable[str]]]) -> str:
+    """
+    replaces the start, end spans of html with the fragments, without parsing
+    either. A fragment is a string or the pieces of one, as a template streams them.
+    """
+    parts = []
+    position = 0
+    for start, end, fragment in sorted(insertions, key=lambda insertion: insertion[0]):
+        parts.append(html[position:start])
+        parts.extend(pieces(fragment))
+        position = end
+    parts.append(html[position:])
+    return "".join(parts)
@@ -1,40 +1,44 @@
+import asyncio
 import os
+import queue
 import random
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from contextlib import contextmanager
+from itertools import chain
+from typing import Iterable, Iterator, NamedTuple
 from PIL import Image, ImageDraw, ImageFont, ImageEnhance
-from wordpressapi.media_api import MediaData
-from wpdata_types import ScraperBotInput, LogoLocation, ImageVariance
-from jinja2 import Environment, FileSystemLoader, Template
-from bs4 import BeautifulSoup, ResultSet
+from base_loader import RESAMPLE, open_base, resize_base
+from array_preprocess import ARRAY_MODES, ArrayWatermark, numpy_available, preprocess_array
+from dedup_index import DedupIndex, content_digest, dedup_marker
+from encoders import ENCODERS, OutputEncoding, OutputWriter, available_formats, content_type_for, encode, write_encoded
+from gallery_renderer import gallery_template, render_gallery
+from html_inject import find_targets, splice
+from metrics import RunMetrics, activate, aiohttp_trace, active, instrumented_run, record_stage, record_stages, stage, \
+    write_report
+from naming import NameGenerator
+from progress import composite_size, report
+from render_cache import RenderCache, file_digest
+from text_layout import OVERLAY_MODES, layout_text, measure, paste_quote
+from upload_journal import JournalEntry, UploadJournal
+from wordpressapi.async_api import AsyncWpApi
+from wordpressapi.listing import ListingError
+from wordpressapi.media_api import MediaData, MediaOutput
+from wordpressapi.wp_api import WpApi
+from wpdata_types import ScraperBotInput, LogoLocation, ImageVariance, ContentMode, OutputFiles, ProgressKind, \
+    PreprocessEngine
+from jinja2 import Template
+try:
+    import resource
+except ImportError:
+    resource = None
 
 
-# Specify the template directory
-template_dir = "templates"
-
-# Create a Jinja2 environment
-env = Environment(loader=FileSystemLoader(template_dir))
-
 def split_text_into_lines(text: str, max_width: int, draw, font):
-    lines = []
-    words = text.split()
-    current_line = ''
-    
-    for word in words:
-        # Check if adding the next word exceeds the max width
-        if textsize(current_line + ' ' + word, font=font)[0] <= max_width:
-            # Add word to the current line
-            if current_line:
-                current_line += ' '
-            current_line += word
-        else:
-            # Add current line to the lines list and start a new line with the current word
-            lines.append(current_line)
-            current_line = word
-    
-    # Add the last line
-    if current_line:
-        lines.append(current_line)
-    
-    return lines
+    return list(layout_text(text, font, max_width).lines)
 
 def get_file(directory: str, filter: list) -> list[str]:
     files = []
@@ -44,7 +48,431 @@ def get_file(directory: str, filter: list) -> list[str]:
     return files
 
 
-def run_image_uploader(bot_input: ScraperBotInput):
+BRIGHTNESS = 0.8
+
+
+def preprocess_base(image_path: str, watermark: Image.Image, image_size: tuple[int, int] | None,
+                    array_watermark: ArrayWatermark | None = None) -> Image.Image:
+    # reduce the brightness of image and resize it
+    with stage("decode"):
+        image_file = open_base(image_path, image_size)
+    if array_watermark and image_file.mode in ARRAY_MODES:
+        return preprocess_array(image_file, array_watermark, image_size)
+    with stage("enhance"):
+        enhancer = ImageEnhance.Brightness(image_file)
+        image_file = enhancer.enhance(BRIGHTNESS)
+    if image_size:
+        with stage("resize"):
+            image_file = resize_base(image_file, image_size)
+    with stage("watermark"):
+        return process_image(image_file, watermark)
+
+
+def load_base(image_path: str, watermark: Image.Image, image_size: tuple[int, int] | None,
+              cache: RenderCache | None, watermark_digest: str,
+              array_watermark: ArrayWatermark | None = None) -> Image.Image:
+    if not cache:
+        return preprocess_base(image_path, watermark, image_size, array_watermark)
+    key = cache.key(image_path, watermark_digest, BRIGHTNESS, image_size,
+                    PreprocessEngine.NumPy.value if array_watermark else "", RESAMPLE.name if image_size else "")
+    image_file = cache.get(key)
+    if image_file is None:
+        image_file = preprocess_base(image_path, watermark, image_size, array_watermark)
+        cache.put(key, image_file)
+    return image_file
+
+
+def estimated_base_bytes(image_path: str, image_size: tuple[int, int] | None) -> int:
+    # opening only reads the header, the pixels are not decoded
+    with Image.open(image_path) as image_file:
+        width, height = image_size or image_file.size
+        return width * height * len(image_file.getbands())
+
+
+def plan_base_chunks(image_paths: list[str], image_size: tuple[int, int] | None,
+                     memory_budget: int | None) -> list[list[int]]:
+    """splits the base images into batches whose decoded size fits in memory_budget bytes"""
+    if not memory_budget:
+        return [list(range(len(image_paths)))]
+    chunks = []
+    current: list[int] = []
+    used = 0
+    for base_index, image_path in enumerate(image_paths):
+        size = estimated_base_bytes(image_path, image_size)
+        if current and used + size > memory_budget:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(base_index)
+        used += size
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def peak_memory_report() -> str:
+    if resource is None:  # not available on windows
+        return "Peak memory: not available on this platform"
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    unit = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 1024 ** 2
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 1024 ** 2
+    return f"Peak memory: {own:.0f} MB, largest render process {children:.0f} MB"
+
+
+class RenderJob(NamedTuple):
+    index: int  # position of the composite in the quote-major upload order
+    quote: str
+    base_index: int
+    file_name: str
+
+
+def load_font(font_file: str | None, font_size: int):
+    if font_file:
+        return ImageFont.truetype(font_file, font_size)
+    return ImageFont.load_default(font_size)
+
+
+def plan_jobs(quotes: list[str], total_bases: int, image_name: str, keywords: list[str],
+              fixed_names: dict[int, str] | None = None, seed: int | None = None,
+              existing_names: Iterable[str] = (), extension: str = ".png") -> list[RenderJob]:
+    """
+    names every composite up front so the order does not depend on when uploads finish.
+    fixed_names are the file names by job index of composites uploaded in an earlier run,
+    existing_names other names the new ones must not collide with, like media slugs.
+    """
+    fixed_names = fixed_names or {}
+    jobs = []
+    names = NameGenerator(image_name, keywords, seed, taken=chain(fixed_names.values(), existing_names))
+    for quote in quotes:
+        for base_index in range(total_bases):
+            if len(jobs) in fixed_names:
+                jobs.append(RenderJob(len(jobs), quote, base_index, fixed_names[len(jobs)]))
+                continue
+            jobs.append(RenderJob(len(jobs), quote, base_index, names.next() + extension))
+    return jobs
+
+
+def existing_media_slugs(wpapis: list[WpApi]) -> set[str]:
+    """
+    slugs of the media already on the sites, new composites are named around
+    them. A site that cannot be listed is left out, a name it already has is
+    then made unique by wordpress with a -1 suffix.
+    """
+    slugs = set()
+    for wpapi in wpapis:
+        try:
+            slugs.update(item["slug"] for item in wpapi.media.list_media(fields=["slug"]))
+        except ListingError as e:
+            print(f"{wpapi}: existing media names unknown, {e}")
+    return slugs
+
+
+def render_composite(img_processed: Image.Image, quote: str, logo: Image.Image, logo_location: LogoLocation, font) -> Image.Image:
+    img_copy = img_processed.copy()
+    img_copy = paste_logo(img_copy, logo, logo_location)
+    if img_copy.mode in OVERLAY_MODES:
+        # the quote is rasterized once per image size and blitted from then on
+        img_copy = paste_quote(img_copy, quote, font)
+    else:
+        img_copy = draw_text(img_copy, quote, font)
+    return img_copy
+
+
+def known_composite(dedup: DedupIndex | None, site: str,
+                    composite: str | bytes) -> tuple[str | None, MediaOutput | None]:
+    """
+    content hash of the composite, a file path or the encoded image, and its
+    media item if the site already has it
+    """
+    if not dedup:
+        return None, None
+    digest = content_digest(composite) if isinstance(composite, bytes) else file_digest(composite)
+    return digest, dedup.lookup(site, digest)
+
+
+def composite_media(composite: str | bytes, image_file_name: str, digest: str | None) -> MediaData:
+    return MediaData(composite, image_file_name, image_file_name,
+                     description=dedup_marker(digest) if digest else '',
+                     content_type=content_type_for(image_file_name))
+
+
+def upload_composite(wpapi: WpApi, composite: str | bytes, image_file_name: str,
+                     dedup: DedupIndex | None = None) -> tuple[bool, MediaOutput | None, str | None, bool]:
+    """created, the media item, the content hash and whether it was sent, it is not when the site has it already"""
+    digest, existing = known_composite(dedup, str(wpapi), composite)
+    if existing:
+        print(f"{image_file_name} is already in the media library as {existing.slug}")
+        return True, existing, None, False
+    created, output = wpapi.media.create_media(composite_media(composite, image_file_name, digest))
+    return created, output, digest, True
+
+
+def uploaded_image_data(image_file_name: str, created: bool, output: MediaOutput | None) -> tuple[str, str] | None:
+    if not created or not output:
+        print(f"{image_file_name} failed to upload!")
+        return None
+    print(f"{image_file_name} successfully uploaded!")
+    siteurl, imglinkpart = output.link.split("wp-content")
+    imglink = f"/wp-content{imglinkpart}"
+    return image_file_name, imglink
+
+
+class UploadResults:
+    """
+    image name and wp link of every job by job index, None until it is uploaded.
+    With a journal every upload is also written to it as soon as it finishes,
+    with a dedup index every new media item is added to it by content hash,
+    with a progress channel every upload and failure is reported on it.
+    """
+
+    def __init__(self, total_jobs: int, image_paths: list[str], site: str = "",
+                 journal: UploadJournal | None = None, dedup: DedupIndex | None = None,
+                 progress: queue.SimpleQueue | None = None) -> None:
+        self.items: list[tuple[str, str] | None] = [None] * total_jobs
+        self.image_paths = image_paths
+        self.site = site
+        self.journal = journal
+        self.dedup = dedup
+        self.progress = progress
+
+    def record(self, job: RenderJob, created: bool, output: MediaOutput | None,
+               digest: str | None = None, seconds: float = 0.0, size: int = 0) -> tuple[str, str] | None:
+        """seconds and size of the upload are only reported on the progress channel"""
+        data = uploaded_image_data(job.file_name, created, output)
+        self.items[job.index] = data
+        report(self.progress, ProgressKind.Uploaded if data else ProgressKind.Failed, job.file_name, seconds, size)
+        if seconds:
+            record_stage("upload", seconds, size if data else 0)
+        if data and self.dedup and digest:
+            self.dedup.add(self.site, digest, output)
+        if data and self.journal:
+            image, quote = UploadJournal.key(self.image_paths[job.base_index], job.quote)
+            self.journal.append(JournalEntry(self.site, image, quote, job.file_name, output.id, data[1]))
+        return data
+
+    def uploaded(self, job: RenderJob) -> bool:
+        return self.items[job.index] is not None
+
+
+def journal_progress(journal: UploadJournal | None, site: str, image_paths: list[str],
+                     quotes: list[str]) -> dict[int, JournalEntry]:
+    """journal entries of the composites already uploaded to the site, by job index"""
+    if not journal:
+        return {}
+    completed = journal.completed(site)
+    finished = {}
+    index = 0
+    for quote in quotes:
+        for image_path in image_paths:
+            entry = completed.get(UploadJournal.key(image_path, quote))
+            if entry:
+                finished[index] = entry
+            index += 1
+    return finished
+
+
+# state of a render worker process, filled once by init_render_worker so the
+# processed bases are pickled once per process instead of once per composite
+_render_worker_state = {}
+
+
+def init_render_worker(processed_images: dict[int, Image.Image], logo: Image.Image, logo_location: LogoLocation,
+                        font_file: str | None, font_size: int, encoding: OutputEncoding = OutputEncoding()):
+    _render_worker_state["images"] = processed_images
+    _render_worker_state["logo"] = logo
+    _render_worker_state["logo_location"] = logo_location
+    _render_worker_state["font"] = load_font(font_file, font_size)
+    _render_worker_state["encoding"] = encoding
+    # a forked worker inherits the parent's run metrics, its timings go back with each composite instead
+    activate(None)
+
+
+def render_in_worker(job: RenderJob, output_image_path: str, in_memory: bool = False) -> str | bytes:
+    """the path the composite was written to, or with in_memory the encoded composite itself"""
+    return render_timed(job, output_image_path, in_memory)[0]
+
+
+def render_timed(job: RenderJob, output_image_path: str,
+                 in_memory: bool = False) -> tuple[str | bytes, dict[str, float]]:
+    """render_in_worker, and the seconds its render and encode stages took in the worker"""
+    start = time.perf_counter()
+    img_copy = render_composite(_render_worker_state["images"][job.base_index], job.quote,
+                                _render_worker_state["logo"], _render_worker_state["logo_location"],
+                                _render_worker_state["font"])
+    rendered = time.perf_counter()
+    if in_memory:
+        composite = encode(img_copy, _render_worker_state["encoding"])
+    else:
+        composite = write_encoded(img_copy, _render_worker_state["encoding"], output_image_path)
+    return composite, {"render": rendered - start, "encode": time.perf_counter() - rendered}
+
+
+def record_render(results: UploadResults, job: RenderJob, timings: dict[str, float]):
+    report(results.progress, ProgressKind.Rendered, job.file_name, sum(timings.values()))
+    record_stages(timings)
+
+
+def upload_timed(wpapi: WpApi, composite: str | bytes, job: RenderJob,
+                 results: UploadResults) -> tuple[str, str] | None:
+    start = time.perf_counter()
+    created, output, digest, sent = upload_composite(wpapi, composite, job.file_name, results.dedup)
+    if not sent:
+        # a media item already on the site is neither an upload sample nor uploaded bytes
+        return results.record(job, created, output)
+    return results.record(job, created, output, digest, time.perf_counter() - start, composite_size(composite))
+
+
+def keep_output(writer: OutputWriter | None, output_image_path: str, composite: str | bytes):
+    """queues an in memory composite to be written, one rendered to a file is there already"""
+    if writer and isinstance(composite, bytes):
+        writer.write(output_image_path, composite)
+
+
+def upload_sequential(bot_input: ScraperBotInput, jobs: list[RenderJob], processed_images: dict[int, Image.Image],
+                      logo: Image.Image, font, results: UploadResults, writer: OutputWriter | None = None):
+    total_posted = 0
+    encoding = output_encoding(bot_input)
+    for job in jobs:
+        start = time.perf_counter()
+        img_copy = render_composite(processed_images[job.base_index], job.quote, logo, bot_input.logo_location, font)
+        rendered = time.perf_counter()
+        # also upload this image to wordpress and get the source url, and save it in the list
+        output_image_path = os.path.join(bot_input.output_folder_path, job.file_name)
+        if bot_input.output_files == OutputFiles.Sync:
+            composite = write_encoded(img_copy, encoding, output_image_path)
+        else:
+            composite = encode(img_copy, encoding)
+        record_render(results, job, {"render": rendered - start, "encode": time.perf_counter() - rendered})
+        keep_output(writer, output_image_path, composite)
+
+        if upload_timed(bot_input.wpapi, composite, job, results):
+            total_posted += 1
+        print(f"Images left {len(jobs) - total_posted}")
+
+
+def upload_pipelined(bot_input: ScraperBotInput, jobs: list[RenderJob], processed_images: dict[int, Image.Image],
+                     logo: Image.Image, font_size: int, results: UploadResults, writer: OutputWriter | None = None):
+    """
+    renders composites in a process pool and uploads them from a bounded thread pool
+    at the same time. At most bot_input.max_pending composites are rendered but not
+    yet uploaded, the next render is not submitted until one of them is uploaded.
+    That also bounds the memory of composites kept in memory instead of on disk.
+    """
+    in_memory = bot_input.output_files != OutputFiles.Sync
+    render_workers = bot_input.render_workers or os.cpu_count() or 1
+    upload_workers = bot_input.upload_workers or 1
+    max_pending = bot_input.max_pending or 2 * (render_workers + upload_workers)
+    bot_input.wpapi.allow_concurrency(upload_workers)
+
+    pending = threading.BoundedSemaphore(max_pending)
+    lock = threading.Lock()
+    counters = {"posted": 0, "failed": 0}
+
+    def upload(job: RenderJob, composite: str | bytes):
+        try:
+            try:
+                keep_output(writer, os.path.join(bot_input.output_folder_path, job.file_name), composite)
+                data = upload_timed(bot_input.wpapi, composite, job, results)
+            except Exception as e:
+                # nothing reads the futures of the upload pool, report it here
+                print(f"{job.file_name} failed to upload: {e!r}")
+                report(results.progress, ProgressKind.Failed, job.file_name)
+                data = None
+            with lock:
+                counters["posted" if data else "failed"] += 1
+                print(f"Images left {len(jobs) - counters['posted']}")
+        finally:
+            pending.release()
+
+    def on_rendered(job: RenderJob, future: Future):
+        try:
+            composite, timings = future.result()
+        except Exception as e:
+            print(f"{job.file_name} failed to render: {e}")
+            report(results.progress, ProgressKind.Failed, job.file_name)
+            with lock:
+                counters["failed"] += 1
+            pending.release()
+            return
+        record_render(results, job, timings)
+        upload_pool.submit(upload, job, composite)
+
+    render_pool = ProcessPoolExecutor(max_workers=render_workers, initializer=init_render_worker,
+                                      initargs=(processed_images, logo, bot_input.logo_location,
+                                                bot_input.font_file, font_size, output_encoding(bot_input)))
+    upload_pool = ThreadPoolExecutor(max_workers=upload_workers)
+    try:
+        for job in jobs:
+            pending.acquire()
+            output_image_path = os.path.join(bot_input.output_folder_path, job.file_name)
+            future = render_pool.submit(render_timed, job, output_image_path, in_memory)
+            future.add_done_callback(partial(on_rendered, job))
+    finally:
+        # the render pool has to finish first, its callbacks still submit uploads
+        render_pool.shutdown(wait=True)
+        upload_pool.shutdown(wait=True)
+
+    print(f"Uploaded {counters['posted']} images, {counters['failed']} failed")
+
+
+async def upload_async(bot_input: ScraperBotInput, jobs: list[RenderJob], processed_images: dict[int, Image.Image],
+                       logo: Image.Image, font_size: int, results: UploadResults, writer: OutputWriter | None = None):
+    """
+    same as upload_pipelined but the uploads are driven by one event loop, with
+    up to bot_input.async_uploads requests in flight to the site.
+    """
+    in_memory = bot_input.output_files != OutputFiles.Sync
+    render_workers = bot_input.render_workers or os.cpu_count() or 1
+    max_pending = bot_input.max_pending or 2 * (render_workers + bot_input.async_uploads)
+
+    loop = asyncio.get_running_loop()
+    pending = asyncio.Semaphore(max_pending)
+    counters = {"posted": 0, "failed": 0}
+
+    async def render_and_upload(job: RenderJob, api: AsyncWpApi):
+        try:
+            output_image_path = os.path.join(bot_input.output_folder_path, job.file_name)
+            composite, timings = await loop.run_in_executor(render_pool, render_timed, job, output_image_path,
+                                                            in_memory)
+            record_render(results, job, timings)
+            if writer:
+                # write waits when the writer is behind, not on the event loop
+                await loop.run_in_executor(None, keep_output, writer, output_image_path, composite)
+            start = time.perf_counter()
+            digest, existing = known_composite(results.dedup, results.site, composite)
+            if existing:
+                print(f"{job.file_name} is already in the media library as {existing.slug}")
+                results.record(job, True, existing)
+            else:
+                created, output = await api.create_media(composite_media(composite, job.file_name, digest))
+                results.record(job, created, output, digest, time.perf_counter() - start, composite_size(composite))
+        except Exception as e:
+            print(f"{job.file_name} failed to render: {e}")
+            report(results.progress, ProgressKind.Failed, job.file_name)
+        finally:
+            counters["posted" if results.uploaded(job) else "failed"] += 1
+            print(f"Images left {len(jobs) - counters['posted']}")
+            pending.release()
+
+    render_pool = ProcessPoolExecutor(max_workers=render_workers, initializer=init_render_worker,
+                                      initargs=(processed_images, logo, bot_input.logo_location,
+                                                bot_input.font_file, font_size, output_encoding(bot_input)))
+    try:
+        trace_configs = [aiohttp_trace(active())] if active() else None
+        async with AsyncWpApi.from_wpapi(bot_input.wpapi, max_concurrency=bot_input.async_uploads,
+                                         trace_configs=trace_configs) as api:
+            tasks = []
+            for job in jobs:
+                await pending.acquire()
+                tasks.append(asyncio.create_task(render_and_upload(job, api)))
+            await asyncio.gather(*tasks)
+    finally:
+        render_pool.shutdown(wait=True)
+
+    print(f"Uploaded {counters['posted']} images, {counters['failed']} failed")
+
+
+def run_image_uploader(bot_input: ScraperBotInput, summary: dict | None = None):
     """
     bot_input.wp_page_id (required): wordpress page id
     bot_input.image_folder_path (required): path of image folder from which to get images
@@ -53,7 +481,8 @@ def run_image_uploader(bot_input: ScraperBotInput):
     bot_input.watermark_file_path (required): path of watermark file
     bot_input.quotes (required): list of quotes to use
     bot_input.keywords (required): list of keywords to use
-    bot_input.image_size (required): image size
+    bot_input.image_size (required): image size, (0, 0) keeps the size of each base image. JPEG bases are decoded
+        straight at a reduced scale that still covers it, then resized with a lanczos filter
     bot_input.image_name (required): name of the image to use as a placeholder
     bot_input.element_id (required): id of the element to which to insert the content
     bot_input.wpapi (required): WpApi class instance
@@ -63,7 +492,138 @@ def run_image_uploader(bot_input: ScraperBotInput):
     bot_input.font_file: font file in otf or ttf to use, defaults to dearpygui default font
     bot_input.font_size: size of font to use defaults to 60
     bot_input.logo_size: size of the logo, defaults to 200, 100 if not given
+    bot_input.upload_workers: number of upload threads, enables the pipelined mode when given
+    bot_input.render_workers: number of render processes in pipelined mode, defaults to cpu count
+    bot_input.max_pending: max composites rendered but not uploaded yet in pipelined mode
+    bot_input.async_uploads: max uploads in flight on one event loop, enables the asyncio mode when given
+    bot_input.cache_dir: folder to keep preprocessed base images in between runs
+    bot_input.cache_max_bytes: size limit of the cache folder, defaults to 2 GB
+    bot_input.memory_budget_mb: memory for decoded base images, they are loaded in batches that fit in it
+    bot_input.journal_path: jsonl file recording finished uploads, a rerun skips what it lists
+    bot_input.dedup_index_path: jsonl file of the composites already in the media library by content hash,
+        identical composites are not uploaded again
+    bot_input.dedup_rebuild: read the dedup index of the site back from its media library before the run
+    bot_input.dedup_max_age_hours: read it back when the site was last synced longer ago than this
+    bot_input.template_file: jinja template for the gallery html, defaults to templates/content_template.html
+    bot_input.name_seed: seed of the random file names, the same seed names a run the same way
+    bot_input.avoid_existing_names: also keep file names clear of the slugs of media already on the site
+    bot_input.output_format: OutputFormat the composites are encoded in, PNG by default
+    bot_input.output_quality: quality of the lossy formats, defaults to the format's own default
+    bot_input.output_max_kb: size target, lossy formats lower the quality until a composite fits
+    bot_input.output_files: OutputFiles, Background and Off upload the encoded composite from memory,
+        Background writes it to the output folder while the uploads go on, Off does not write it
+    bot_input.preprocess_engine: PreprocessEngine, NumPy darkens and watermarks the base images in place
+        in one array, the same pixels as the Pillow engine, needs numpy
+    bot_input.progress: queue the run puts ProgressEvents on as composites are rendered and uploaded,
+        for a gui to show progress without waiting on the run
+    bot_input.content_mode: ContentMode, Replace and AppendOwned only touch the block the uploader marked
+        in each element, and the page is not updated when its content comes out the same
+
+    bot_input.metrics_path: json file the run report is written to, timings of every stage with
+        p50/p95/p99, bytes uploaded, http status counts and retries
+    bot_input.prometheus_path: file the run report is written to in the prometheus text format
+    bot_input.profile_path: runs this process under cProfile and saves the profile here
+    bot_input.trace_memory: traces allocations with tracemalloc, the top ones go in the run report
+
+    summary: if given, filled with the image counts of the run and whether the page was updated
     """
+    with measured_run(bot_input, [bot_input.wpapi]):
+        return upload_and_publish(bot_input, summary)
+
+
+@contextmanager
+def measured_run(bot_input: ScraperBotInput, wpapis: list[WpApi]) -> Iterator[RunMetrics]:
+    """collects the run metrics of the block, prints their summary and writes the reports asked for"""
+    run_metrics = RunMetrics()
+    retries_before = sum(wpapi.scheduler.retries for wpapi in wpapis)
+    try:
+        with instrumented_run(run_metrics, [wpapi.session for wpapi in wpapis], bot_input.profile_path,
+                              bot_input.trace_memory):
+            yield run_metrics
+    finally:
+        run_metrics.add_retries(sum(wpapi.scheduler.retries for wpapi in wpapis) - retries_before)
+        print(run_metrics.summary())
+        write_report(run_metrics, bot_input.metrics_path, bot_input.prometheus_path)
+
+
+def upload_and_publish(bot_input: ScraperBotInput, summary: dict | None = None) -> bool:
+    logo_size, font_size, image_size = resolve_sizes(bot_input)
+    font = load_font(bot_input.font_file, font_size)
+
+    images = get_file(bot_input.image_folder_path, [".png", ".jpg", ".jpeg"])
+    
+    print(f"Total images Found in folder {bot_input.image_folder_path}: {len(images)}")
+    print(f"Total Quotes Found in file: {len(bot_input.quotes)}")
+    
+    total_images = len(images) * len(bot_input.quotes)
+    
+    print(f"total images to post {total_images}")
+    logo = Image.open(bot_input.logo_file_path).resize(logo_size)
+    watermark = Image.open(bot_input.watermark_file_path)
+    array_watermark = open_array_watermark(bot_input, watermark)
+    cache, watermark_digest = open_base_cache(bot_input)
+
+    render_processes = bool(bot_input.async_uploads or bot_input.upload_workers)
+    chunks = plan_base_chunks(images, image_size, memory_budget_bytes(bot_input, render_processes))
+    if len(chunks) > 1:
+        print(f"Processing images in {len(chunks)} batches to stay in the memory budget")
+
+    journal = UploadJournal(bot_input.journal_path) if bot_input.journal_path else None
+    finished = journal_progress(journal, str(bot_input.wpapi), images, bot_input.quotes)
+    jobs = plan_jobs(bot_input.quotes, len(images), bot_input.image_name, bot_input.keywords,
+                     {index: entry.file_name for index, entry in finished.items()}, bot_input.name_seed,
+                     existing_media_slugs([bot_input.wpapi]) if bot_input.avoid_existing_names else (),
+                     ENCODERS[bot_input.output_format].extension)
+    results = UploadResults(len(jobs), images, str(bot_input.wpapi), journal,
+                            open_dedup_index(bot_input, [bot_input.wpapi]), bot_input.progress)
+    for index, entry in finished.items():
+        results.items[index] = (entry.file_name, entry.link)
+    remaining_jobs = [job for job in jobs if job.index not in finished]
+    if finished:
+        print(f"Resuming from journal: {len(finished)} images already uploaded, {len(remaining_jobs)} left")
+    report(bot_input.progress, ProgressKind.Started, count=len(remaining_jobs))
+
+    writer = OutputWriter(bot_input.max_pending or 8) if bot_input.output_files == OutputFiles.Background else None
+    for chunk in chunks:
+        chunk_bases = set(chunk)
+        chunk_jobs = [job for job in remaining_jobs if job.base_index in chunk_bases]
+        if not chunk_jobs:
+            continue
+        # Put logo on the bottom left corner of the image
+        processed_images = {base_index: load_base(images[base_index], watermark, image_size, cache, watermark_digest,
+                                                  array_watermark)
+                            for base_index in {job.base_index for job in chunk_jobs}}
+        if bot_input.async_uploads:
+            asyncio.run(upload_async(bot_input, chunk_jobs, processed_images, logo, font_size, results, writer))
+        elif bot_input.upload_workers:
+            upload_pipelined(bot_input, chunk_jobs, processed_images, logo, font_size, results, writer)
+        else:
+            upload_sequential(bot_input, chunk_jobs, processed_images, logo, font, results, writer)
+        del processed_images
+    if writer:
+        writer.close()
+        if writer.failed:
+            print(f"{writer.failed} composites could not be written to {bot_input.output_folder_path}")
+    if cache:
+        print(f"Render cache: {cache.hits} hits, {cache.misses} misses")
+    if results.dedup:
+        print(f"Dedup index: {results.dedup.skipped} uploads skipped")
+    print(peak_memory_report())
+
+    start = time.perf_counter()
+    updated = publish_images(bot_input, bot_input.wpapi, bot_input.wp_page_id, bot_input.element_id,
+                             results.items, len(images))
+    if updated:
+        report(bot_input.progress, ProgressKind.PageUpdated, seconds=time.perf_counter() - start)
+    if summary is not None:
+        uploaded = sum(1 for r in results.items if r)
+        summary.update({"images_total": len(jobs), "uploaded": uploaded,
+                        "failed": len(jobs) - uploaded, "page_updated": updated})
+    return updated
+
+
+def resolve_sizes(bot_input: ScraperBotInput) -> tuple[tuple[int, int], int, tuple[int, int] | None]:
+    """logo size, font size and image size of the run, with the defaults filled in"""
     #region Filtering input
     if not bot_input.logo_size:
         logo_size = (200, 100)
@@ -74,149 +634,145 @@ def run_image_uploader(bot_input: ScraperBotInput):
     else:
         font_size = bot_input.font_size
 
-    if bot_input.font_file:
-        font = ImageFont.truetype(bot_input.font_file, font_size)
-    else:
-        font = ImageFont.load_default(font_size)
     if bot_input.image_size[0] == 0 or bot_input.image_size[1] == 0:
         image_size = None
     else:
         image_size = bot_input.image_size 
     # endregion
+    return logo_size, font_size, image_size
 
-    images = get_file(bot_input.image_folder_path, [".png", ".jpg", ".jpeg"])
-    
-    print(f"Total images Found in folder {bot_input.image_folder_path}: {len(images)}")
-    print(f"Total Quotes Found in file: {len(bot_input.quotes)}")
-    
-    total_images = len(images) * len(bot_input.quotes)
-    total_posted = 0
-    
-    print(f"total images to post {total_images}")
-    # Put logo on the bottom left corner of the image
-    PROCESSED_IMAGES: list[Image.Image] = []
 
-    logo = Image.open(bot_input.logo_file_path).resize(logo_size)
-    watermark = Image.open(bot_input.watermark_file_path)
+def open_base_cache(bot_input: ScraperBotInput) -> tuple[RenderCache | None, str]:
+    if not bot_input.cache_dir:
+        return None, ""
+    cache = RenderCache(bot_input.cache_dir, bot_input.cache_max_bytes or 2 * 1024 ** 3)
+    return cache, file_digest(bot_input.watermark_file_path)
 
-    images_data: list[tuple[str, str]] = []  # list of tuples containing image name and wp link
-    random_names_occupied = []
 
-    for image_path in images:
-        # reduce the brightness of image and resize it
-        image_file = Image.open(image_path)
-        enhancer = ImageEnhance.Brightness(image_file)
-        image_file = enhancer.enhance(0.8)
-        if image_size:
-            image_file = image_file.resize(image_size)    
-        image_file = process_image(image_file, watermark)
-        PROCESSED_IMAGES.append(image_file)
-
-    for quote in bot_input.quotes:
-        for img_processed in PROCESSED_IMAGES:                
-            img_copy = img_processed.copy()
-            img_copy = paste_logo(img_copy, logo, bot_input.logo_location)
-            img_copy = draw_text(img_copy, quote, font)
-            random_name = f"{bot_input.image_name}_{random.choice(bot_input.keywords)}"
-            while True:
-                if random_name not in random_names_occupied:
-                    break
-                else:
-                    random_name += f"_{random.choice(bot_input.keywords)}"
-            image_file_name = random_name + ".png"
-            random_names_occupied.append(random_name) 
-
-            # also upload this image to wordpress and get the source url, and save it in the list
-            output_image_path = os.path.join(bot_input.output_folder_path, image_file_name) 
-            img_copy.save(output_image_path)
-
-            media_input = MediaData(output_image_path, image_file_name, image_file_name)
-            created, output = bot_input.wpapi.media.create_media(media_input)
-            if created and output:
-                print(f"{image_file_name} successfully uploaded!")
-                total_posted += 1
-
-            print(f"Images left {total_images - total_posted}")
-            siteurl, imglinkpart = output.link.split("wp-content")
-            imglink = f"/wp-content{imglinkpart}"
-            images_data.append((image_file_name, imglink ))
+def open_array_watermark(bot_input: ScraperBotInput, watermark: Image.Image) -> ArrayWatermark | None:
+    """the watermark ready for the NumPy engine, None with the Pillow one"""
+    if bot_input.preprocess_engine != PreprocessEngine.NumPy:
+        return None
+    if not numpy_available():
+        raise ValueError("the NumPy preprocessing engine needs numpy installed")
+    return ArrayWatermark(watermark, BRIGHTNESS)
+
+
+def output_encoding(bot_input: ScraperBotInput) -> OutputEncoding:
+    if bot_input.output_format not in available_formats():
+        raise ValueError(f"this Pillow build cannot write {bot_input.output_format.value} images")
+    max_bytes = bot_input.output_max_kb * 1024 if bot_input.output_max_kb else None
+    return OutputEncoding(bot_input.output_format, bot_input.output_quality, max_bytes)
+
+
+def open_dedup_index(bot_input: ScraperBotInput, wpapis: list[WpApi]) -> DedupIndex | None:
+    if not bot_input.dedup_index_path:
+        return None
+    dedup = DedupIndex(bot_input.dedup_index_path)
+    max_age = bot_input.dedup_max_age_hours * 3600 if bot_input.dedup_max_age_hours is not None else None
+    for wpapi in wpapis:
+        dedup.sync(wpapi, bot_input.dedup_rebuild, max_age)
+    return dedup
+
+
+def memory_budget_bytes(bot_input: ScraperBotInput, render_processes: bool) -> int | None:
+    if not bot_input.memory_budget_mb:
+        return None
+    memory_budget = bot_input.memory_budget_mb * 1024 ** 2
+    if render_processes:
+        # every render process holds its own copy of the bases
+        memory_budget //= (bot_input.render_workers or os.cpu_count() or 1) + 1
+    return memory_budget
 
+
+def publish_images(bot_input: ScraperBotInput, wpapi: WpApi, wp_page_id: str, element_id: str,
+                   results: list[tuple[str, str] | None], total_bases: int) -> bool:
     if bot_input.image_variance == ImageVariance.DifferentQuote:
-        images_data = change_order(images_data, len(PROCESSED_IMAGES))
+        results = change_order(results, total_bases)
+    # failed uploads keep their slot until here so change_order sees the full grid
+    images_data: list[tuple[str, str]] = [r for r in results if r]  # list of tuples containing image name and wp link
     # create the page content with those image links and update the 
     # content to the page id 
     print("Creating html from images data.")
     
-    # Load the template
-    template = env.get_template("content_template.html")
-    post_content = bot_input.wpapi.page.get_content(bot_input.wp_page_id)
-    content = update_content(template, post_content, bot_input.element_id, images_data, bot_input.img_count_attribute_name)
-    if content:
-        updated = bot_input.wpapi.page.update_content(bot_input.wp_page_id, content)
+    # Load the template, compiled once per process
+    template = gallery_template(bot_input.template_file)
+    # the marked blocks are only reliable in the content as stored, not in its rendered html
+    owned = bot_input.content_mode != ContentMode.Append
+    with stage("page_fetch"):
+        post_content = wpapi.page.get_content(wp_page_id, raw=owned)
+    if post_content is None:
+        # not an empty page, the page could not be fetched
+        print(f"could not fetch page {wp_page_id} of {wpapi}, its content is not updated")
+        return False
+    with stage("update_content"):
+        content = update_content(template, post_content, element_id, images_data, bot_input.img_count_attribute_name,
+                                 bot_input.content_mode)
+    updated = False
+    if content and content == post_content:
+        print(f"content of {wpapi} is unchanged, not updating it")
+        updated = True
+    elif content:
+        with stage("page_update"):
+            updated = wpapi.page.update_content(wp_page_id, content)
         if updated:
-            print("content uploaded!")
-            return True
+            print(f"content uploaded to {wpapi}!")
         else:
-            print("Content failed to upload")
-            return False
+            print(f"Content failed to upload to {wpapi}")
     else:
-        print(f"element with id {bot_input.element_id} not found!")
-        return False    
+        print(f"element with id {element_id} not found!")
+    return updated
 
 def textsize(text, font):
-    im = Image.new(mode="P", size=(0, 0))
-    draw = ImageDraw.Draw(im)
-    _, _, width, height = draw.textbbox((0, 0), text=text, font=font)
-    return width, height
-
-def update_content(template: Template, post_content: str, element_id: str, images_data: list[tuple[str, str]], count_attribute: str) -> str:
-    bs = BeautifulSoup(post_content, 'lxml')
-    target_elements: ResultSet = bs.find_all(id=element_id)
+    return measure(text, font)
+
+def update_content(template: Template, post_content: str, element_id: str, images_data: list[tuple[str, str]], count_attribute: str,
+                   mode: ContentMode = ContentMode.Append) -> str:
+    targets = find_targets(post_content, element_id, count_attribute)
+    if not targets:
+        return ""
+    if mode != ContentMode.Append and not images_data:
+        return post_content  # nothing uploaded, keep the earlier runs' images
+    # the style is already on the page when appending to an earlier run's blocks
+    render_style = not (mode == ContentMode.AppendOwned and any(target.owned for target in targets))
     # distribute evenly among the elements
     # if it finds a image_count attribute, it renderers that about of images
     # there and distribute the left over evenly, if image_count is greater than
     # total images, then it will just render all images there.
 
-    # create a hashmap out of the elements with required id, with fields
-    # has_count: bool, which says if it has a count attribute, 
-    target_element_data = []
-    for element in target_elements:
-        edata = {"element": element}
-        if count_attribute in element.attrs:
-            edata["has_count"] = True
-            try:
-                image_count = int(element.attrs[count_attribute])
-                edata["count"] = image_count
-            except ValueError:
-                edata["has_count"] = False
-        else:
-            edata["has_count"] = False
-        target_element_data.append(edata)
-    # loop over the key and values, and check if it has count attribute
+    # loop over the elements, and check if it has count attribute
     # if it has render that amount of images and put it in that tag
-    # if it doesnt have it get the amount of image by deviding the left over 
+    # if it doesnt have it get the amount of image by deviding the left over
     # images with number of elements left to put in the content
-    total_elements = len(target_element_data)
+    total_elements = len(targets)
     image_start_index = 0
-    for i, element_data in enumerate(target_element_data):
+    insertions = []
+    for target in targets:
         if image_start_index < len(images_data):
-            if element_data["has_count"]:
-                img_count = element_data["count"] 
-                available_images = len(images_data) - image_start_index 
+            if target.count is not None:
+                img_count = target.count
+                available_images = len(images_data) - image_start_index
                 img_count = min([img_count, available_images])
                 if img_count == 0:
                     img_count = available_images
-                images_till_index = image_start_index + (img_count % len(images_data)) 
+                images_till_index = image_start_index + (img_count % len(images_data))
             else:
                 images_till_index = int(image_start_index + (len(images_data) / total_elements))
             ctx = {"images": images_data[image_start_index: images_till_index]}
             if image_start_index == 0:
-                ctx["render_style"] = True
+                ctx["render_style"] = render_style
             image_start_index = images_till_index
-            image_content = template.render(ctx)
-            element_data["element"].append(BeautifulSoup(image_content, "lxml"))
-    
-    return str(bs)
+            # the rendered html goes in as it is, the page is never parsed into a tree
+            fragment = render_gallery(template, **ctx)
+            if mode == ContentMode.Append:
+                insertions.append(target.insertion(fragment))
+            else:
+                insertions.append(target.owned_insertion(fragment, replace=mode == ContentMode.Replace))
+        elif mode == ContentMode.Replace and target.owned:
+            # this run has no images left for the element, its earlier ones go
+            insertions.append((*target.owned, ""))
+
+    return splice(post_content, insertions)
 
 def process_image(image: Image.Image, watermark: Image.Image):
     image.paste(watermark, (image.width // 2 - watermark.width // 2, 
@@ -233,22 +789,19 @@ def draw_text(image: Image.Image, quote: str, font):
     text_area_width = int(image.width * 0.80)  # 80% of the original width
     # text_area_left_offset = (image.width - text_area_width) // 2  # Calculate the left offset
 
-    lines = split_text_into_lines(quote, text_area_width, draw, font)
-
-    # Calculate total height of all lines
-    total_height = sum(textsize(line, font=font)[1] for line in lines)
-    y_offset = (image.height - total_height) // 2
+    # the layout is cached, backgrounds of the same width reuse it
+    layout = layout_text(quote, font, text_area_width)
+    y_offset = (image.height - layout.total_height) // 2
 
     # Draw each line
-    for line in lines:
-        text_width, text_height = textsize(line, font=font)
+    for line, (text_width, text_height) in zip(layout.lines, layout.sizes):
         text_position = ((image.width - text_width) // 2) - 10, y_offset
         draw.text(text_position, line, font=font, fill="white")
         y_offset += text_height
 
     return image
 
-def change_order(data_list: list[tuple[str, str]], total_quotes: int):
+def change_order(data_list: list, total_quotes: int):
     new_list = []
     i = 0
     while i < total_quotes:
@@ -1,17 +1,28 @@
-import csv
+import multiprocessing
 import os
+import queue
 import sys
 import threading
 import time
 import dearpygui.dearpygui as dpg
 
-from wordpressapi.wp_api import WpApi
+from wordpressapi.wp_api import WpApi, load_credentials
 from image_uploader import run_image_uploader
-from wpdata_types import GuiTags, ScraperBotInput, LogoLocation, WindowsIds, ImageVariance
+from progress import ProgressStats
+from wpdata_types import GuiTags, ScraperBotInput, LogoLocation, WindowsIds, ImageVariance, ContentMode, OutputFormat, OutputFiles, PreprocessEngine
+from encoders import available_formats
+from array_preprocess import numpy_available
 
 
 SCREEN_WIDTH, SCREEN_HEIGHT = 1200, 700
+# seconds between refreshes of the progress panel, events are still taken every frame
+PROGRESS_REFRESH = 0.25
 csv_cred_file_path = "credentials.csv"
+render_cache_dir = ".render_cache"
+dedup_index_path = ".dedup_index.jsonl"
+dedup_max_age_hours = 24
+listing_cache_dir = ".listing_cache"
+metrics_path = "last_run_metrics.json"
 
 IMAGE, FONT, TEXT = "image", "font", "text"
 
@@ -37,8 +48,13 @@ class GUI:
         # Wordpress pages is a dict of page titles and their ids in wordpress
         self.wordpress_pages: dict[str, int] = {"Please Refresh to Load Pages": -1}
         self.refresh_in_progress = False
+        self.refresh_thread = None
+        self.fetched_pages: dict[str, int] = {}
         self.current_window = WindowsIds.Main_Window
         self.scrapingthread = None
+        self.progress: queue.SimpleQueue | None = None
+        self.progress_stats = ProgressStats()
+        self.progress_shown_at = 0.0
 
     def load_credentials(self):
         if not os.path.exists(csv_cred_file_path):
@@ -49,16 +65,7 @@ class GUI:
             print("Please add username, password and site url")
             sys.exit()
 
-        websites_apis = {}
-
-        with open(csv_cred_file_path, newline='') as csvfile:
-            creds_reader = csv.reader(csvfile, delimiter=",")
-            for row in list(creds_reader)[1:]:
-                username, password, url = row
-                wp_api = WpApi(username=username, app_password=password, site_url=url)
-                websites_apis[str(wp_api)] = wp_api
-
-        return websites_apis
+        return load_credentials(csv_cred_file_path, listing_cache_dir)
 
     def popup_message(self, text, add_okay=True):
         with dpg.window(label="Popup", width=200, height=150, pos=[SCREEN_WIDTH//2 - 100, SCREEN_HEIGHT//2 - 100],  no_close=True, no_collapse=True, tag=GuiTags.Popup_Msg_TagId.value, modal=True, ):
@@ -89,9 +96,32 @@ class GUI:
                     dpg.add_file_extension("Source files (*.txt){.txt}", color=(0, 255, 255, 255))
 
     def update_page_combo(self, sender, app_data):
+        """lists the pages in a thread, check_refresh_status fills the combo when it is done"""
+        if self.refresh_in_progress:
+            return
         self.refresh_in_progress = True
         self.popup_message("Refreshing please wait!", add_okay=False)
-        self.wordpress_pages = self.websites_apis[self.current_site].page.list_pages()
+        dpg.configure_item(GuiTags.Refresh_Wp_Pages.value, enabled=False)
+        dpg.configure_item(GuiTags.Change_Credentials_Button.value, enabled=False)
+        wpapi = self.websites_apis[self.current_site]
+        self.refresh_thread = threading.Thread(target=self.fetch_pages, args=(wpapi,), daemon=True)
+        self.refresh_thread.start()
+
+    def fetch_pages(self, wpapi: WpApi):
+        try:
+            self.fetched_pages = wpapi.page.list_pages()
+        except Exception as e:
+            print(f"could not list the pages of {wpapi}: {e!r}")
+            self.fetched_pages = {}
+
+    def check_refresh_status(self):
+        if not self.refresh_thread or self.refresh_thread.is_alive():
+            return
+        self.refresh_thread = None
+        self.refresh_in_progress = False
+        dpg.configure_item(GuiTags.Refresh_Wp_Pages.value, enabled=True)
+        dpg.configure_item(GuiTags.Change_Credentials_Button.value, enabled=True)
+        self.wordpress_pages = self.fetched_pages
         self.pages_titles = list(self.wordpress_pages.keys())
         if not self.pages_titles:
             dpg.delete_item(GuiTags.Popup_Msg_TagId.value)
@@ -278,9 +308,46 @@ class GUI:
                               indent=110, 
                               tag=GuiTags.Image_Variance_Tag.value, width=300,
                               )
+                with dpg.group(horizontal=True):
+                    dpg.add_text("Output Format: ")
+                    dpg.add_combo([output_format.value for output_format in available_formats()],
+                              default_value=OutputFormat.PNG.value,
+                              indent=110,
+                              tag=GuiTags.Output_Format_Tag.value, width=300,
+                              )
+                with dpg.group(horizontal=True):
+                    dpg.add_text("Output Files: ")
+                    dpg.add_combo([output_files.value for output_files in OutputFiles],
+                              default_value=OutputFiles.Sync.value,
+                              indent=110,
+                              tag=GuiTags.Output_Files_Tag.value, width=300,
+                              )
+                with dpg.group(horizontal=True):
+                    dpg.add_text("Preprocessing: ")
+                    dpg.add_combo([engine.value for engine in PreprocessEngine
+                                   if engine != PreprocessEngine.NumPy or numpy_available()],
+                              default_value=PreprocessEngine.Pillow.value,
+                              indent=110,
+                              tag=GuiTags.Preprocess_Engine_Tag.value, width=300,
+                              )
+                with dpg.group(horizontal=True):
+                    dpg.add_text("Page Content: ")
+                    dpg.add_combo([mode.value for mode in ContentMode],
+                              default_value=ContentMode.Append.value,
+                              indent=110,
+                              tag=GuiTags.Content_Mode_Tag.value, width=300,
+                              )
                 with dpg.group(horizontal=True):
                     dpg.add_text("Image Count Attribute Name: ")
                     dpg.add_input_text(tag=GuiTags.Image_Count_Name.value, width=150, indent=200)
+                with dpg.group(horizontal=True):
+                    dpg.add_text("Upload Workers: ")
+                    dpg.add_input_int(tag=GuiTags.Upload_Workers_Id.value, default_value=0, min_value=0, width=130, indent=200)
+                dpg.add_text("leave 0 to render and upload one by one")
+                dpg.add_separator()
+                dpg.add_text("Progress")
+                dpg.add_progress_bar(default_value=0.0, overlay="idle", width=-1, tag=GuiTags.Progress_Bar_Tag.value)
+                dpg.add_text("", tag=GuiTags.Progress_Text_Tag.value)
 
             dpg.add_spacer(width=SCREEN_WIDTH, height=50)
             dpg.add_button(label="Start Bot", callback=self.start_bot, width=300, pos=[SCREEN_WIDTH//2 - 160, SCREEN_HEIGHT - 80], tag=GuiTags.Start_Bot.value)
@@ -346,6 +413,14 @@ class GUI:
         image_variance = dpg.get_value(GuiTags.Image_Variance_Tag.value)
         logo_location_enum = next(i for i in LogoLocation if i.value == logo_location)
         image_variance_enum = next(i for i in ImageVariance if i.value == image_variance)
+        content_mode = dpg.get_value(GuiTags.Content_Mode_Tag.value)
+        content_mode_enum = next(i for i in ContentMode if i.value == content_mode)
+        output_format = dpg.get_value(GuiTags.Output_Format_Tag.value)
+        output_format_enum = next(i for i in OutputFormat if i.value == output_format)
+        output_files = dpg.get_value(GuiTags.Output_Files_Tag.value)
+        output_files_enum = next(i for i in OutputFiles if i.value == output_files)
+        preprocess_engine = dpg.get_value(GuiTags.Preprocess_Engine_Tag.value)
+        preprocess_engine_enum = next(i for i in PreprocessEngine if i.value == preprocess_engine)
         img_width = dpg.get_value(GuiTags.Image_Width_Id.value)
         img_height = dpg.get_value(GuiTags.Image_Height_Id.value)
         
@@ -354,11 +429,12 @@ class GUI:
         font_size = dpg.get_value(GuiTags.Font_Size_Id.value)
         element_id = dpg.get_value(GuiTags.ElementId.value)
         img_count_attribute_name = dpg.get_value(GuiTags.Image_Count_Name.value)
+        upload_workers = dpg.get_value(GuiTags.Upload_Workers_Id.value)
         if not img_count_attribute_name:
             self.popup_message("please add image count \nattribute name!")
             return
         
-        if img_width < 0 or img_height < 0 or font_size < 0 or logo_width < 0 or logo_height < 0:     
+        if img_width < 0 or img_height < 0 or font_size < 0 or logo_width < 0 or logo_height < 0 or upload_workers < 0:     
             self.popup_message("Value cant be negative!")
             return
 
@@ -368,6 +444,8 @@ class GUI:
             logo_size = (logo_width, logo_height)
         if not font_size:
             font_size = None
+        if not upload_workers:
+            upload_workers = None
 
         if not element_id:
             self.popup_message("Element Id Missing")
@@ -397,7 +475,14 @@ class GUI:
                             keywords=keywords, image_size=image_size, image_name=image_name, element_id=element_id,
                             wpapi=self.websites_apis[self.current_site], logo_location=logo_location_enum, image_variance=image_variance_enum, 
                             img_count_attribute_name=img_count_attribute_name, font_file=fontfile,
-                            font_size=font_size, logo_size=logo_size)
+                            font_size=font_size, logo_size=logo_size, upload_workers=upload_workers,
+                            cache_dir=render_cache_dir, dedup_index_path=dedup_index_path, content_mode=content_mode_enum,
+                            output_format=output_format_enum, output_files=output_files_enum,
+                            preprocess_engine=preprocess_engine_enum,
+                            progress=self.new_progress_channel(), metrics_path=metrics_path,
+                            # listing the whole media library is slow on a big site, media deleted on
+                            # it is picked up by the next sync
+                            dedup_max_age_hours=dedup_max_age_hours)
         self.start_bot_thread(scraper_bot_input)
         
     def start_bot_thread(self, scraper_bot_input: ScraperBotInput):
@@ -405,9 +490,32 @@ class GUI:
         self.start_time = time.perf_counter()
         self.scrapingthread.start()
 
+    def new_progress_channel(self) -> queue.SimpleQueue:
+        self.progress = queue.SimpleQueue()
+        self.progress_stats = ProgressStats()
+        self.progress_shown_at = 0.0
+        return self.progress
+
+    def update_progress(self, force=False):
+        """takes the run's progress events without waiting for any and shows them a few times a second"""
+        if self.progress is None:
+            return
+        self.progress_stats.drain(self.progress)
+        now = time.monotonic()
+        if not force and now - self.progress_shown_at < PROGRESS_REFRESH:
+            return
+        self.progress_shown_at = now
+        stats = self.progress_stats
+        dpg.set_value(GuiTags.Progress_Bar_Tag.value, stats.fraction)
+        dpg.configure_item(GuiTags.Progress_Bar_Tag.value, overlay=f"{stats.done}/{stats.total}")
+        dpg.set_value(GuiTags.Progress_Text_Tag.value, stats.summary(now))
+
     def main_loop(self):
+        # nothing here waits on the network, the bot and the page refresh run in their own threads
         while dpg.is_dearpygui_running():
             dpg.render_dearpygui_frame()
+            self.update_progress()
+            self.check_refresh_status()
             self.check_bot_status()
 
         dpg.destroy_context()
@@ -415,12 +523,15 @@ class GUI:
     def check_bot_status(self):
         if self.scrapingthread and not self.scrapingthread.is_alive():
             self.scrapingthread = None
+            # the last events of the run come in after the previous refresh
+            self.update_progress(force=True)
             dpg.configure_item(GuiTags.Start_Bot.value, enabled=True)
             dpg.configure_item(GuiTags.Refresh_Wp_Pages.value, enabled=True)
             dpg.configure_item(GuiTags.Change_Credentials_Button.value, enabled=True)
             self.end_time = time.perf_counter()
             dpg.set_value(GuiTags.Start_Bot.value, "Start Bot")
-            self.popup_message(f"Completed\n In {self.end_time - self.start_time:.2f} seconds")
+            self.popup_message(f"Completed\n In {self.end_time - self.start_time:.2f} seconds\n"
+                               f"report: {metrics_path}")
             self.start_time = None
             self.end_time = None
 
@@ -441,6 +552,8 @@ class GUI:
         dpg.bind_theme(global_theme)
 
 if __name__ == "__main__":
+    # the pipelined mode renders in worker processes, which need this in a frozen build
+    multiprocessing.freeze_support()
     gui = GUI()
     gui.initiate_gui()
     gui.main_loop()
@@ -0,0 +1,243 @@
+import cProfile
+import io
+import json
+import math
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterator
+
+import aiohttp
+import requests
+
+
+# stages of a run in the order they happen, the report lists them in this order
+STAGES = ("decode", "enhance", "resize", "watermark", "render", "encode", "upload",
+          "page_fetch", "update_content", "page_update")
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def quantile(samples: list[float], q: float) -> float:
+    """nearest rank quantile of sorted samples"""
+    if not samples:
+        return 0.0
+    return samples[max(0, math.ceil(q * len(samples)) - 1)]
+
+
+class RunMetrics:
+    """
+    timings of every stage of a run, bytes uploaded, http status counts and
+    retries. Safe to update from the upload threads and the event loop alike.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.samples: dict[str, list[float]] = {}
+        self.bytes_uploaded = 0
+        self.http_statuses: Counter[int] = Counter()
+        self.retries = 0
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.extra: dict = {}  # profiler and tracemalloc results end up here
+
+    def observe(self, stage: str, seconds: float):
+        with self.lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def observe_all(self, timings: dict[str, float]):
+        """stage timings measured elsewhere, like in a render process"""
+        with self.lock:
+            for stage, seconds in timings.items():
+                self.samples.setdefault(stage, []).append(seconds)
+
+    def add_bytes(self, size: int):
+        with self.lock:
+            self.bytes_uploaded += size
+
+    def count_response(self, status: int, retries: int = 0):
+        with self.lock:
+            self.http_statuses[status] += 1
+            self.retries += retries
+
+    def add_retries(self, count: int):
+        """retries made above the http adapter, by the site schedulers"""
+        with self.lock:
+            self.retries += count
+
+    def stage_report(self, stage: str) -> dict:
+        with self.lock:
+            samples = sorted(self.samples.get(stage, ()))
+        report = {"count": len(samples), "total": sum(samples), "mean": sum(samples) / len(samples) if samples else 0.0,
+                  "max": samples[-1] if samples else 0.0}
+        for q in QUANTILES:
+            report[f"p{round(q * 100)}"] = quantile(samples, q)
+        return report
+
+    def report(self) -> dict:
+        """the run report, everything in it is json serializable"""
+        with self.lock:
+            stages = [stage for stage in STAGES if stage in self.samples]
+            stages += sorted(stage for stage in self.samples if stage not in STAGES)
+            statuses = {str(status): count for status, count in sorted(self.http_statuses.items())}
+        return {"started_at": self.started_at, "duration_seconds": time.perf_counter() - self.start,
+                "stages": {stage: self.stage_report(stage) for stage in stages},
+                "bytes_uploaded": self.bytes_uploaded, "http_statuses": statuses, "retries": self.retries,
+                **self.extra}
+
+    def prometheus(self, prefix: str = "wpiu") -> str:
+        """the report in the prometheus text format, stage timings as summaries"""
+        report = self.report()
+        lines = [f"# HELP {prefix}_stage_seconds time spent in each stage of the run",
+                 f"# TYPE {prefix}_stage_seconds summary"]
+        for stage, stats in report["stages"].items():
+            for q in QUANTILES:
+                lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{q}"}} '
+                             f'{stats[f"p{round(q * 100)}"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {stats["total"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        lines += [f"# HELP {prefix}_uploaded_bytes_total bytes of the composites uploaded",
+                  f"# TYPE {prefix}_uploaded_bytes_total counter",
+                  f"{prefix}_uploaded_bytes_total {report['bytes_uploaded']}",
+                  f"# HELP {prefix}_http_responses_total responses from the site by status code",
+                  f"# TYPE {prefix}_http_responses_total counter"]
+        lines += [f'{prefix}_http_responses_total{{status="{status}"}} {count}'
+                  for status, count in report["http_statuses"].items()]
+        lines += [f"# HELP {prefix}_http_retries_total requests sent again after a failed attempt",
+                  f"# TYPE {prefix}_http_retries_total counter",
+                  f"{prefix}_http_retries_total {report['retries']}",
+                  f"# HELP {prefix}_run_duration_seconds wall time of the run",
+                  f"# TYPE {prefix}_run_duration_seconds gauge",
+                  f"{prefix}_run_duration_seconds {report['duration_seconds']:.6f}"]
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        lines = [f"{'stage':<16}{'count':>7}{'total s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+        for stage, stats in self.report()["stages"].items():
+            lines.append(f"{stage:<16}{stats['count']:>7}{stats['total']:>10.2f}{stats['p50'] * 1000:>10.1f}"
+                         f"{stats['p95'] * 1000:>10.1f}{stats['p99'] * 1000:>10.1f}")
+        return "\n".join(lines)
+
+
+# the metrics of the run in progress in this process, stages deep in the
+# image code are timed into it without passing it through every call
+_active: RunMetrics | None = None
+
+
+def activate(metrics: RunMetrics | None):
+    global _active
+    _active = metrics
+
+
+def active() -> RunMetrics | None:
+    return _active
+
+
+def record_stage(stage_name: str, seconds: float, size: int = 0):
+    """adds a timing, and bytes uploaded in it, to the active run's metrics"""
+    if _active is not None:
+        _active.observe(stage_name, seconds)
+        if size:
+            _active.add_bytes(size)
+
+
+def record_stages(timings: dict[str, float]):
+    if _active is not None:
+        _active.observe_all(timings)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """times the block into the active run's metrics, if there is one"""
+    if _active is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _active.observe(name, time.perf_counter() - start)
+
+
+def instrument_session(session: requests.Session, metrics: RunMetrics):
+    """counts the status of every response of the session and the retries the adapter made for it"""
+    def count(response: requests.Response, *args, **kwargs):
+        retries = getattr(response.raw, "retries", None)
+        metrics.count_response(response.status_code, len(retries.history) if retries else 0)
+
+    session.hooks["response"].append(count)
+    return count
+
+
+def uninstrument_session(session: requests.Session, hook):
+    if hook in session.hooks["response"]:
+        session.hooks["response"].remove(hook)
+
+
+def aiohttp_trace(metrics: RunMetrics) -> aiohttp.TraceConfig:
+    """an aiohttp TraceConfig counting the status of every response"""
+    async def on_request_end(session, context, params):
+        metrics.count_response(params.response.status)
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_end.append(on_request_end)
+    return trace
+
+
+@contextmanager
+def profiled(metrics: RunMetrics, profile_path: str | None = None, trace_memory: bool = False,
+             top: int = 15) -> Iterator[None]:
+    """
+    runs the block under cProfile and or tracemalloc. The profile is saved to
+    profile_path for pstats or snakeviz, the top functions by cumulative time
+    and the top allocation sites go into the run report. Only this process is
+    profiled, not the render processes.
+    """
+    profiler = cProfile.Profile() if profile_path else None
+    if trace_memory:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(top)
+            metrics.extra["profile"] = {"path": profile_path, "top_cumulative": text.getvalue()}
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            metrics.extra["memory"] = {
+                "peak_bytes": peak,
+                "top_allocations": [{"where": str(stat.traceback), "bytes": stat.size, "count": stat.count}
+                                    for stat in snapshot.statistics("lineno")[:top]]}
+
+
+@contextmanager
+def instrumented_run(metrics: RunMetrics, sessions: list[requests.Session], profile_path: str | None = None,
+                     trace_memory: bool = False) -> Iterator[RunMetrics]:
+    """makes metrics the active ones of this process and counts the responses of the sessions for the block"""
+    hooks = [(session, instrument_session(session, metrics)) for session in sessions]
+    activate(metrics)
+    try:
+        with profiled(metrics, profile_path, trace_memory):
+            yield metrics
+    finally:
+        activate(None)
+        for session, hook in hooks:
+            uninstrument_session(session, hook)
+
+
+def write_report(metrics: RunMetrics, json_path: str | None = None, prometheus_path: str | None = None):
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(metrics.report(), f, indent=2)
+    if prometheus_path:
+        with open(prometheus_path, "w") as f:
+            f.write(metrics.prometheus())
@@ -0,0 +1,56 @@
+import random
+import re
+from typing import Iterable
+
+
+def slug_key(name: str) -> str:
+    """what wordpress makes of a file name as a media slug, names equal under it collide"""
+    name = name.rsplit(".", 1)[0] if name.endswith((".png", ".jpg", ".jpeg", ".webp", ".avif")) else name
+    return re.sub(r"[^a-z0-9_-]+", "-", name.lower()).strip("-")
+
+
+class NameGenerator:
+    """
+    unique file names made of a prefix and random keywords. A name gets up to
+    max_keywords keywords while they keep colliding, after that a counter is
+    added, so names never grow past max_length and every check is a set lookup.
+    The same seed gives the same names.
+    """
+
+    def __init__(self, prefix: str, keywords: list[str], seed: int | None = None, max_keywords: int = 2,
+                 max_length: int = 80, taken: Iterable[str] = ()) -> None:
+        self.prefix = prefix
+        self.keywords = keywords
+        self.random = random.Random(seed)
+        self.max_keywords = max_keywords
+        self.max_length = max_length
+        self.taken = {slug_key(name) for name in taken}
+        self.counters: dict[str, int] = {}
+
+    def _take(self, name: str) -> bool:
+        key = slug_key(name)
+        if key in self.taken:
+            return False
+        self.taken.add(key)
+        return True
+
+    def next(self) -> str:
+        """a name without extension that no earlier one collides with"""
+        name = f"{self.prefix}_{self.random.choice(self.keywords)}"[:self.max_length]
+        if self._take(name):
+            return name
+        base = name
+        for _ in range(self.max_keywords - 1):
+            candidate = f"{name}_{self.random.choice(self.keywords)}"[:self.max_length]
+            if self._take(candidate):
+                return candidate
+            name = candidate
+        # the counter of a base carries on where it stopped, it is not searched from 2 again
+        count = self.counters.get(base, 1)
+        while True:
+            count += 1
+            suffix = f"_{count}"
+            candidate = base[:self.max_length - len(suffix)] + suffix
+            if self._take(candidate):
+                self.counters[base] = count
+                return candidate
@@ -0,0 +1,127 @@
+import os
+import queue
+import time
+from collections import deque
+from typing import NamedTuple
+from wpdata_types import ProgressKind
+
+
+class ProgressEvent(NamedTuple):
+    kind: ProgressKind
+    at: float  # time.monotonic() when it happened
+    file_name: str = ""
+    seconds: float = 0.0  # how long the stage took
+    size: int = 0  # bytes of the composite
+    count: int = 0
+
+
+def report(channel: queue.SimpleQueue | None, kind: ProgressKind, file_name: str = "", seconds: float = 0.0,
+           size: int = 0, count: int = 0):
+    """puts an event on the channel, if the run has one. Safe to call from any thread."""
+    if channel is not None:
+        channel.put(ProgressEvent(kind, time.monotonic(), file_name, seconds, size, count))
+
+
+def composite_size(composite: str | bytes) -> int:
+    """bytes of a composite given as its encoded data or as the path it was written to"""
+    if isinstance(composite, bytes):
+        return len(composite)
+    try:
+        return os.path.getsize(composite)
+    except OSError:
+        return 0
+
+
+class ProgressStats:
+    """
+    running totals of the events of a run, with throughput, eta and the mean
+    latency of each stage over its last `window` events
+    """
+
+    def __init__(self, window: int = 50) -> None:
+        self.total = 0
+        self.rendered = 0
+        self.uploaded = 0
+        self.failed = 0
+        self.bytes_uploaded = 0
+        self.page_updated = False
+        self.started_at: float | None = None
+        self.last_at: float | None = None
+        self.latencies = {kind: deque(maxlen=window)
+                          for kind in (ProgressKind.Rendered, ProgressKind.Uploaded, ProgressKind.PageUpdated)}
+
+    def add(self, event: ProgressEvent):
+        self.last_at = event.at
+        if event.kind == ProgressKind.Started:
+            self.total += event.count
+            if self.started_at is None:
+                self.started_at = event.at
+        elif event.kind == ProgressKind.Rendered:
+            self.rendered += 1
+        elif event.kind == ProgressKind.Uploaded:
+            self.uploaded += 1
+            self.bytes_uploaded += event.size
+        elif event.kind == ProgressKind.Failed:
+            self.failed += 1
+        elif event.kind == ProgressKind.PageUpdated:
+            self.page_updated = True
+        if event.kind in self.latencies:
+            self.latencies[event.kind].append(event.seconds)
+
+    def drain(self, channel: queue.SimpleQueue, limit: int = 1000) -> int:
+        """adds the events waiting on the channel without blocking, at most limit of them"""
+        added = 0
+        while added < limit:
+            try:
+                self.add(channel.get_nowait())
+            except queue.Empty:
+                break
+            added += 1
+        return added
+
+    @property
+    def done(self) -> int:
+        return self.uploaded + self.failed
+
+    @property
+    def fraction(self) -> float:
+        return self.done / self.total if self.total else 0.0
+
+    def elapsed(self, now: float | None = None) -> float:
+        """seconds since the run started, up to its last event once everything is done"""
+        if self.started_at is None:
+            return 0.0
+        if self.total and self.done >= self.total:
+            return self.last_at - self.started_at
+        return (now or time.monotonic()) - self.started_at
+
+    def images_per_second(self, now: float | None = None) -> float:
+        elapsed = self.elapsed(now)
+        return self.uploaded / elapsed if elapsed > 0 else 0.0
+
+    def bytes_per_second(self, now: float | None = None) -> float:
+        elapsed = self.elapsed(now)
+        return self.bytes_uploaded / elapsed if elapsed > 0 else 0.0
+
+    def eta(self, now: float | None = None) -> float | None:
+        """seconds left at the rate so far, None until something is done"""
+        elapsed = self.elapsed(now)
+        if not self.done or elapsed <= 0:
+            return None
+        return (self.total - self.done) * elapsed / self.done
+
+    def latency(self, kind: ProgressKind) -> float | None:
+        samples = self.latencies[kind]
+        return sum(samples) / len(samples) if samples else None
+
+    def summary(self, now: float | None = None) -> str:
+        now = now or time.monotonic()
+        eta = self.eta(now)
+        lines = [f"{self.done}/{self.total} done, {self.failed} failed, {self.rendered} rendered",
+                 f"{self.images_per_second(now):.2f} images/s, {self.bytes_per_second(now) / 1024:.0f} KB/s",
+                 f"elapsed {self.elapsed(now):.0f}s, eta " + (f"{eta:.0f}s" if eta is not None else "-")]
+        for kind in self.latencies:
+            latency = self.latency(kind)
+            if latency is not None:
+                lines.append(f"{kind.value}: {latency * 1000:.0f} ms")
+        return "\n".join(lines)
@@ -0,0 +1,92 @@
+import hashlib
+import os
+from PIL import Image
+
+
+def file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+class RenderCache:
+    """
+    on disk cache of preprocessed base images. Entries are keyed by a hash of
+    everything that goes into them, and the least recently used ones are
+    deleted when the folder grows over max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 2 * 1024 ** 3) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._total_bytes = sum(size for _, size, _ in self._entries())
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def key(self, source_path: str, watermark_digest: str, brightness: float,
+            image_size: tuple[int, int] | None, engine: str = "", resample: str = "") -> str:
+        """
+        engine tells apart bases preprocessed in ways that round differently, empty for the Pillow one,
+        resample the filter they were resized with, empty for the bicubic resize of earlier versions
+        """
+        params = f"{file_digest(source_path)}|{watermark_digest}|{brightness}|{image_size}"
+        if engine:
+            params += f"|{engine}"
+        if resample:
+            params += f"|{resample}"
+        return hashlib.sha256(params.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".png")
+
+    def get(self, key: str) -> Image.Image | None:
+        path = self._path(key)
+        try:
+            image = Image.open(path)
+            image.load()
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        os.utime(path)  # mark as recently used
+        self.hits += 1
+        return image
+
+    def put(self, key: str, image: Image.Image):
+        """best effort, an image png cannot store (a CMYK jpeg) or a full disk just leaves it uncached"""
+        path = self._path(key)
+        # write to a temporary name first so a crash never leaves half an entry
+        tmp_path = path + ".tmp"
+        try:
+            image.save(tmp_path, format="PNG", compress_level=1)
+            os.replace(tmp_path, path)
+        except (OSError, ValueError) as e:
+            print(f"Render cache: base not cached, {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self._total_bytes += os.path.getsize(path)
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".png"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+        self._total_bytes = total
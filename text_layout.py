@@ -0,0 +1,105 @@
+from functools import lru_cache
+from typing import NamedTuple
+from PIL import Image, ImageDraw
+
+
+class TextLayout(NamedTuple):
+    lines: tuple[str, ...]
+    sizes: tuple[tuple[int, int], ...]  # width and height of every line
+    total_height: int
+
+
+@lru_cache(maxsize=65536)
+def measure(text: str, font) -> tuple[int, int]:
+    """
+    width and height of the text's bounding box drawn at (0, 0), the same
+    numbers ImageDraw.textbbox gives on a "P" image, without allocating one
+    """
+    _, _, width, height = font.getbbox(text, mode="1")
+    return width, height
+
+
+@lru_cache(maxsize=65536)
+def advance(text: str, font) -> float:
+    return font.getlength(text)
+
+
+@lru_cache(maxsize=1024)
+def layout_text(text: str, font, max_width: int) -> TextLayout:
+    """
+    breaks text into lines no wider than max_width. Candidate line widths are
+    estimated from cached word advances, the exact bounding box is only measured
+    when the estimate is too close to max_width to decide, so long texts are
+    laid out in linear time.
+    """
+    # kerning and glyph overhang keep the estimate within this of the real width
+    tolerance = getattr(font, "size", 10)
+    space = advance(" ", font)
+    lines = []
+    current_line = ''
+    current_advance = 0.0
+
+    for word in text.split():
+        # a line is always measured with the separating space, even when empty
+        candidate_advance = current_advance + space + advance(word, font)
+        if candidate_advance + tolerance < max_width:
+            fits = True
+        elif candidate_advance - tolerance > max_width:
+            fits = False
+        else:
+            fits = measure(current_line + ' ' + word, font)[0] <= max_width
+
+        if fits:
+            if current_line:
+                current_line += ' '
+                current_advance += space
+            current_line += word
+            current_advance += advance(word, font)
+        else:
+            lines.append(current_line)
+            current_line = word
+            current_advance = advance(word, font)
+
+    if current_line:
+        lines.append(current_line)
+
+    sizes = tuple(measure(line, font) for line in lines)
+    return TextLayout(tuple(lines), sizes, sum(height for _, height in sizes))
+
+
+class LineMask(NamedTuple):
+    mask: Image.Image
+    position: tuple[int, int]
+
+
+# modes where pasting a color through an "L" glyph mask blends exactly like ImageDraw.text
+OVERLAY_MODES = ("RGB", "RGBA", "L")
+
+
+@lru_cache(maxsize=256)
+def quote_overlay(quote: str, font, image_size: tuple[int, int]) -> tuple[LineMask, ...]:
+    """
+    rasterizes a quote once for every image of the given size. Every line is
+    kept as its own glyph coverage mask, cropped to its bounding box, together
+    with the position it is pasted at, the same place draw_text draws it.
+    """
+    width, height = image_size
+    layout = layout_text(quote, font, int(width * 0.80))
+    y_offset = (height - layout.total_height) // 2
+    line_masks = []
+    for line, (text_width, text_height) in zip(layout.lines, layout.sizes):
+        x, y = ((width - text_width) // 2) - 10, y_offset
+        left, top, right, bottom = font.getbbox(line)
+        if right > left and bottom > top:
+            mask = Image.new("L", (right - left, bottom - top))
+            ImageDraw.Draw(mask).text((-left, -top), line, font=font, fill=255)
+            line_masks.append(LineMask(mask, (x + left, y + top)))
+        y_offset += text_height
+    return tuple(line_masks)
+
+
+def paste_quote(image: Image.Image, quote: str, font, fill="white") -> Image.Image:
+    """same result as drawing the quote with draw_text, from a cached overlay"""
+    for line_mask in quote_overlay(quote, font, image.size):
+        image.paste(fill, line_mask.position, line_mask.mask)
+    return image
@@ -0,0 +1,52 @@
+import json
+import os
+import threading
+from typing import NamedTuple
+
+
+class JournalEntry(NamedTuple):
+    site: str
+    image: str  # absolute path of the base image
+    quote: str
+    file_name: str
+    media_id: int | str | None
+    link: str  # /wp-content/... link as it goes in the page
+
+
+class UploadJournal:
+    """
+    append only jsonl file with one line per finished upload, so a run that
+    stops halfway can be started again without uploading anything twice
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(image_path: str, quote: str) -> tuple[str, str]:
+        return os.path.abspath(image_path), quote
+
+    def completed(self, site: str) -> dict[tuple[str, str], JournalEntry]:
+        """finished uploads of a site keyed by (image, quote)"""
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = JournalEntry(**json.loads(line))
+                except (ValueError, TypeError):
+                    # the last line is cut short when the process died while writing it
+                    continue
+                if entry.site == site:
+                    entries[(entry.image, entry.quote)] = entry
+        return entries
+
+    def append(self, entry: JournalEntry):
+        line = json.dumps(entry._asdict()) + "\n"
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
@@ -0,0 +1,264 @@
+import asyncio
+import traceback
+from pathlib import Path
+from typing import Awaitable, Callable
+import aiohttp
+from wordpressapi.listing import ListingError
+from wordpressapi.media_api import (MediaData, MediaOutput, WordpressApiMediaCrud,
+                                    created_media_output, media_fields, metadata_dropped)
+from wordpressapi.scheduler import SiteScheduler, retry_after_seconds
+from wordpressapi.wp_api import WpApi
+
+
+class AsyncWpApi:
+    """
+    asyncio version of WpApi. At most max_concurrency requests are in flight
+    to the site at once, fewer while the site's scheduler backs off, and they
+    are retried like the requests of WpApi. Pass the same aiohttp session to
+    the clients of several sites to have them share one connection pool.
+    """
+    headers = {"Content-Type": "application/json; charset=utf-8"}
+
+    def __init__(self, site_url: str, username: str, app_password: str,
+                 max_concurrency: int = 20, timeout: float = 120,
+                 session: aiohttp.ClientSession | None = None,
+                 trace_configs: list[aiohttp.TraceConfig] | None = None,
+                 scheduler: SiteScheduler | None = None) -> None:
+        self.site_url = site_url
+        self.username = username
+        self.app_password = app_password
+        self.site_media_url = self.site_url + "/wp-json/wp/v2/media"
+        self.site_page_url = self.site_url + "/wp-json/wp/v2/pages"
+
+        self.auth = aiohttp.BasicAuth(username, app_password)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_concurrency = max_concurrency
+        self.scheduler = scheduler or SiteScheduler(max_concurrency)
+        self.session = session
+        self._owns_session = session is None
+        self.trace_configs = trace_configs  # only used for the session it creates itself
+        self.multipart_upload = True
+
+    @classmethod
+    def from_wpapi(cls, wpapi: WpApi, **kwargs) -> "AsyncWpApi":
+        """
+        a client of the same site, paced by the same scheduler as wpapi, which
+        lets max_concurrency requests be in flight unless the site has its own cap
+        """
+        api = cls(wpapi.site_url, wpapi.username, wpapi.app_password, scheduler=wpapi.scheduler, **kwargs)
+        wpapi.scheduler.allow_concurrency(api.max_concurrency)
+        return api
+
+    async def __aenter__(self) -> "AsyncWpApi":
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.max_concurrency)
+            self.session = aiohttp.ClientSession(connector=connector, trace_configs=self.trace_configs)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _request(self, method: str, url: str, read: Callable[[aiohttp.ClientResponse], Awaitable],
+                       idempotent: bool = False, form: Callable[[], aiohttp.FormData] | None = None, **kwargs):
+        """
+        sends the request once the scheduler lets it and returns what read makes
+        of the response, retried the way ScheduledSession retries. A form is
+        given as the function building it, a sent FormData cannot be sent again.
+        """
+        attempt = 0
+        while True:
+            started = await self.scheduler.acquire_async()
+            status = retry_after = None
+            try:
+                async with self.session.request(method, url, timeout=self.timeout,
+                                                **({"data": form()} if form else {}), **kwargs) as res:
+                    status = res.status
+                    retry_after = retry_after_seconds(res.headers.get("Retry-After"))
+                    if not self.scheduler.should_retry(status, idempotent, attempt):
+                        return await read(res)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                # aiohttp does not retry failed connections the way the requests adapter does
+                if not idempotent or attempt >= self.scheduler.max_retries:
+                    raise
+            finally:
+                self.scheduler.release(started, status, retry_after)
+            delay = self.scheduler.retry_delay(attempt, retry_after)
+            print(f"{method} {url}: {status or 'connection failed'}, attempt {attempt + 2} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def create_media(self, media_data: MediaData) -> tuple[bool, MediaOutput | None]:
+        if isinstance(media_data.file_path, str):
+            with open(media_data.file_path, 'rb') as f:
+                img_data = f.read()
+        else:
+            img_data = media_data.file_path
+
+        for _ in range(2):
+            try:
+                status, created = await self._post_media(img_data, media_data)
+                if status not in WordpressApiMediaCrud.ambiguous_codes:
+                    return created
+                print(f"{media_data.file_name}: {status} from {self.site_url}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"{media_data.file_name}: {e!r}")
+                if isinstance(e, aiohttp.ClientConnectorError):
+                    # it never reached the site
+                    return False, None
+            # the upload may have been stored before the answer got lost, look before sending it again
+            existing = await self.find_media(media_data.file_name)
+            if existing:
+                print(f"{media_data.file_name} was uploaded as {existing.slug} despite the error")
+                return True, existing._replace(alt_text=media_data.alt_text or '')
+        return False, None
+
+    async def _post_media(self, img_data: bytes, media_data: MediaData) -> tuple[int, tuple[bool, MediaOutput | None]]:
+        """uploads the file, with its metadata when the site takes multipart uploads"""
+        async def created(res: aiohttp.ClientResponse, metadata_sent: bool):
+            return res.status, await self._created_output(res, media_data, metadata_sent)
+
+        if self.multipart_upload:
+            def form() -> aiohttp.FormData:
+                data = aiohttp.FormData()
+                data.add_field("file", img_data, filename=media_data.file_name, content_type=media_data.content_type)
+                for name, value in media_fields(media_data).items():
+                    data.add_field(name, value)
+                return data
+
+            async def read(res: aiohttp.ClientResponse):
+                if res.status in WordpressApiMediaCrud.multipart_rejected_codes:
+                    return res.status, None
+                return await created(res, metadata_sent=True)
+
+            status, output = await self._request("POST", self.site_media_url, read, form=form, auth=self.auth)
+            if output is not None:
+                return status, output
+            print(f"multipart upload rejected by {self.site_url} ({status}), uploading raw file")
+            self.multipart_upload = False
+
+        img_header = {
+            'Content-Type': media_data.content_type,
+            'Content-Disposition': 'attachment; filename=%s' % media_data.file_name
+        }
+        return await self._request("POST", self.site_media_url, lambda res: created(res, metadata_sent=False),
+                                   data=img_data, headers=img_header, auth=self.auth)
+
+    async def _created_output(self, res: aiohttp.ClientResponse, media_data: MediaData,
+                              metadata_sent: bool) -> tuple[bool, MediaOutput | None]:
+        if res.status != 201:
+            if res.status not in WordpressApiMediaCrud.ambiguous_codes:
+                print(res.status, (await res.text())[:500])
+            return False, None
+
+        try:
+            data = await res.json(content_type=None)
+            output = created_media_output(data, media_data)
+        except (ValueError, KeyError, TypeError):
+            print(f"{media_data.file_name}: unexpected answer from {self.site_url}: {(await res.text())[:500]}")
+            return False, None
+        if not metadata_sent or metadata_dropped(data, media_data):
+            await self._request("POST", f"{self.site_media_url}/{data['id']}", self._ignore, idempotent=True,
+                                json=media_fields(media_data), auth=self.auth)
+        return True, output
+
+    async def find_media(self, file_name: str) -> MediaOutput | None:
+        """the media item uploaded from a file of that name, if the site has one"""
+        params = {"search": Path(file_name).stem, "per_page": 100, "_fields": "id,slug,guid,title,alt_text"}
+        try:
+            items, _ = await self._request("GET", self.site_media_url, self._read_page, idempotent=True,
+                                           params=params, auth=self.auth)
+            for item in items:
+                # a name that was taken already gets -1, -2... appended, those are other uploads
+                if item["guid"]["rendered"].rsplit("/", 1)[-1] == file_name:
+                    return MediaOutput(id=item["id"], slug=item["slug"], link=item["guid"]["rendered"],
+                                       alt_text=item.get("alt_text", ''), title=item["title"]["rendered"])
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError, TypeError) as e:
+            print(f"{file_name}: could not look up earlier uploads: {e!r}")
+        return None
+
+    @staticmethod
+    async def _ignore(res: aiohttp.ClientResponse):
+        return None
+
+    @staticmethod
+    async def _read_page(res: aiohttp.ClientResponse) -> tuple[list, int]:
+        if res.status != 200:
+            return [], 0
+        return await res.json(), int(res.headers.get("X-WP-TotalPages", 1))
+
+    @staticmethod
+    async def _read_listed_page(res: aiohttp.ClientResponse) -> tuple[list, int]:
+        if res.status != 200:
+            raise ListingError(f"{res.url}: status {res.status}")
+        items = await res.json(content_type=None)
+        if not isinstance(items, list):
+            raise ListingError(f"{res.url}: not a listing")
+        return items, int(res.headers.get("X-WP-TotalPages", 1))
+
+    async def _list_page(self, url: str, params: dict) -> tuple[list, int]:
+        return await self._request("GET", url, self._read_listed_page, idempotent=True, headers=self.headers,
+                                   params=params, auth=self.auth)
+
+    async def _list_collection(self, url: str, fields: list[str] | None = None, per_page: int = 100) -> list:
+        """
+        every item of a collection, the pages after the first are fetched
+        concurrently. Raises ListingError like list_collection does.
+        """
+        params = {"per_page": per_page}
+        if fields:
+            params["_fields"] = ",".join(fields)
+        try:
+            items, total_pages = await self._list_page(url, {**params, "page": 1})
+            pages = await asyncio.gather(*(self._list_page(url, {**params, "page": page})
+                                           for page in range(2, total_pages + 1)))
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            raise ListingError(f"{url}: could not be listed, {e!r}") from e
+        for page_items, _ in pages:
+            items.extend(page_items)
+        return items
+
+    async def list_media(self, fields: list[str] | None = None, per_page: int = 100) -> list:
+        return await self._list_collection(self.site_media_url, fields, per_page)
+
+    async def list_pages(self) -> dict[str, int]:
+        """returns a dictionary with page title as key and its wordpress id, raises ListingError if they could not be listed"""
+        pages_data = {}
+        for page in await self._list_collection(self.site_page_url, ["id", "title"]):
+            pages_data[page['title']['rendered']] = page['id']
+        return pages_data
+
+    async def get_content(self, page_id: str, raw: bool = False) -> str | None:
+        # the raw content as stored is only given to an authenticated edit context
+        extra = {"params": {"context": "edit"}, "auth": self.auth} if raw else {}
+
+        async def read(res: aiohttp.ClientResponse) -> str | None:
+            if res.status == 200:
+                return (await res.json())["content"]["raw" if raw else "rendered"]
+            return None
+
+        try:
+            return await self._request("GET", f"{self.site_page_url}/{page_id}", read, idempotent=True,
+                                       headers=self.headers, **extra)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(e)
+        return None
+
+    async def update_content(self, page_id: str, content: str) -> bool:
+        async def read(res: aiohttp.ClientResponse) -> bool:
+            return res.status == 200
+
+        try:
+            # setting the content twice leaves the page as setting it once, it can be retried
+            return await self._request("POST", f"{self.site_page_url}/{page_id}", read, idempotent=True,
+                                       json={"content": content}, auth=self.auth)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            print(traceback.format_exc())
+            return False
+
+    def __str__(self) -> str:
+        return f"{self.site_url}"
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from wordpressapi.scheduler import ScheduledSession
+
+
+class ListingError(Exception):
+    """a collection could not be listed in full, a listing with pages missing is never returned"""
+
+
+class ListingCache:
+    """
+    on disk copy of listed collections, one json file per collection holding
+    every page of it with the ETag and Last-Modified it was sent with, so the
+    next listing only has to revalidate them.
+    """
+
+    def __init__(self, cache_dir: str) -> None:
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(url: str, username: str, params: dict) -> str:
+        return hashlib.sha256(f"{url}|{username}|{sorted(params.items())}".encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def get(self, key: str) -> dict | None:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, listing: dict):
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(listing, f)
+        os.replace(tmp_path, path)
+
+
+def list_collection(session: requests.Session | ScheduledSession, url: str, auth: tuple[str, str], timeout,
+                    fields: list[str] | None = None, per_page: int = 100, max_workers: int = 8,
+                    cache: ListingCache | None = None) -> list[dict]:
+    """
+    every item of a wp rest collection. The first page gives X-WP-TotalPages,
+    the other pages are then fetched in parallel. With a cache, pages are sent
+    conditionally and the ones that did not change (304) are taken from it.
+    Raises ListingError when a page could not be fetched or read, an empty
+    list is an empty collection.
+    """
+    params = {"per_page": per_page}
+    if fields:
+        params["_fields"] = ",".join(fields)
+    key = ListingCache.key(url, auth[0], params)
+    cached = (cache.get(key) if cache else None) or {"total_pages": 1, "pages": {}}
+
+    def get_page(page: int) -> tuple[dict | None, requests.Response]:
+        headers = {}
+        old = cached["pages"].get(str(page))
+        if old and old.get("etag"):
+            headers["If-None-Match"] = old["etag"]
+        if old and old.get("last_modified"):
+            headers["If-Modified-Since"] = old["last_modified"]
+        try:
+            response = session.get(url, params={**params, "page": page}, headers=headers, auth=auth, timeout=timeout)
+        except requests.RequestException as e:
+            raise ListingError(f"{url}: page {page} could not be listed, {e}") from e
+        if response.status_code == 304 and old:
+            return old, response
+        if response.status_code != 200:
+            return None, response
+        try:
+            items = response.json()
+        except ValueError:
+            return None, response
+        if not isinstance(items, list):
+            return None, response
+        return {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified"),
+                "items": items}, response
+
+    def failed(page: int, response: requests.Response) -> ListingError:
+        answer = "not a listing" if response.status_code == 200 else f"status {response.status_code}"
+        return ListingError(f"{url}: page {page} could not be listed, {answer}")
+
+    first, response = get_page(1)
+    if first is None:
+        raise failed(1, response)
+    total_pages = int(response.headers.get("X-WP-TotalPages", cached["total_pages"] if response.status_code == 304 else 1))
+    pages = {"1": first}
+    if total_pages > 1:
+        with ThreadPoolExecutor(max_workers=min(max_workers, total_pages - 1)) as pool:
+            for page, (data, response) in zip(range(2, total_pages + 1),
+                                              pool.map(get_page, range(2, total_pages + 1))):
+                if data is None:
+                    # a listing with a hole in it is neither kept nor returned
+                    raise failed(page, response)
+                pages[str(page)] = data
+
+    if cache:
+        cache.put(key, {"total_pages": total_pages, "pages": pages})
+    return [item for page in range(1, total_pages + 1) for item in pages[str(page)]["items"]]
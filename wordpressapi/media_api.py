@@ -3,6 +3,10 @@ import os
 from pathlib import Path
 from typing import NamedTuple
 import requests
+from urllib3.exceptions import NewConnectionError
+from wordpressapi.listing import ListingCache, list_collection
+from wordpressapi.scheduler import ScheduledSession, create_scheduled_session
+from wordpressapi.session import DEFAULT_TIMEOUT
 
 
 class MediaData(NamedTuple):
@@ -10,6 +14,8 @@ class MediaData(NamedTuple):
     file_name: str
     alt_text: str | None = ''
     caption: str | None = ''
+    description: str | None = ''
+    content_type: str = 'image/png'
 
 class MediaOutput(NamedTuple):
     id: str | None
@@ -18,45 +24,130 @@ class MediaOutput(NamedTuple):
     alt_text: str = ''
     title: str = ''
 
+def created_media_output(data: dict, media_data: MediaData) -> MediaOutput:
+    return MediaOutput(id=data["id"], 
+                       slug=data["slug"],
+                       link=data["guid"]["rendered"],
+                       alt_text=media_data.alt_text, # type: ignore
+                       title=data["title"]["rendered"]
+                      )
+
+def media_fields(media_data: MediaData) -> dict[str, str]:
+    """the metadata fields sent along with an upload"""
+    fields = {"alt_text": media_data.alt_text or '', "caption": media_data.caption or ''}
+    if media_data.description:
+        fields["description"] = media_data.description
+    return fields
+
+def metadata_dropped(data: dict, media_data: MediaData) -> bool:
+    return data.get("alt_text", media_data.alt_text) != media_data.alt_text
+
+def never_sent(error: requests.RequestException) -> bool:
+    """whether the request failed before reaching the site, which then cannot have stored anything"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
 class WordpressApiMediaCrud:
     headers = {"Content-Type": "application/json; charset=utf-8"}
+    # status codes meaning the site does not accept multipart uploads with fields
+    multipart_rejected_codes = (400, 415, 501)
+    # status codes of a gateway that gave up waiting, the site may still have stored the upload
+    ambiguous_codes = (502, 504)
     
-    def __init__(self, site_url: str, username: str, app_password: str) -> None:
+    def __init__(self, site_url: str, username: str, app_password: str,
+                 session: ScheduledSession | None = None, timeout=DEFAULT_TIMEOUT,
+                 listing_cache: ListingCache | None = None) -> None:
         self.site_url = site_url 
         self.media_url_part = "/wp-json/wp/v2/media"
         self.site_media_url = self.site_url + self.media_url_part
         self.username = username
         self.app_password = app_password
+        self.session = session or create_scheduled_session()
+        self.timeout = timeout
+        self.multipart_upload = True
+        self.listing_cache = listing_cache
 
     def create_media(self, media_data: MediaData) -> tuple[bool, MediaOutput | None]:
-        image_name = media_data.file_name
         if isinstance(media_data.file_path, str):
-            img_data = open(media_data.file_path, 'rb').read()
+            with open(media_data.file_path, 'rb') as f:
+                img_data = f.read()
         else:
             img_data = media_data.file_path
-            
+
+        for _ in range(2):
+            try:
+                res, metadata_sent = self._post_media(img_data, media_data)
+                if res.status_code not in self.ambiguous_codes:
+                    return self._created_output(res, media_data, metadata_sent)
+                print(f"{media_data.file_name}: {res.status_code} from {self.site_url}")
+            except requests.RequestException as e:
+                print(f"{media_data.file_name}: {e!r}")
+                if never_sent(e):
+                    return False, None
+            # the upload may have been stored before the answer got lost, look before sending it again
+            existing = self.find_media(media_data.file_name)
+            if existing:
+                print(f"{media_data.file_name} was uploaded as {existing.slug} despite the error")
+                return True, existing._replace(alt_text=media_data.alt_text or '')
+        return False, None
+
+    def _post_media(self, img_data: bytes, media_data: MediaData) -> tuple[requests.Response, bool]:
+        """uploads the file, with its metadata when the site takes multipart uploads"""
+        if self.multipart_upload:
+            res = self._upload_with_metadata(img_data, media_data)
+            if res.status_code not in self.multipart_rejected_codes:
+                return res, True
+            # the site does not take multipart uploads, use the two step flow from now on
+            print(f"multipart upload rejected by {self.site_url} ({res.status_code}), uploading raw file")
+            self.multipart_upload = False
+
         img_header = { 
-            'Content-Type': 'image/png',
-            'Content-Disposition' : 'attachment; filename=%s'% image_name
+            'Content-Type': media_data.content_type,
+            'Content-Disposition' : 'attachment; filename=%s'% media_data.file_name
         }
-        
-        res = requests.post(self.site_media_url, data=img_data, auth=(self.username, self.app_password), headers=img_header)
-        if res.status_code == 201:
-            output = MediaOutput(id=res.json()["id"], 
-                                 slug=res.json()["slug"],
-                                 link=res.json()["guid"]["rendered"],
-                                #  link=res.json()['_links']['self'][0]['href'],
-                                 alt_text=media_data.alt_text, # type: ignore
-                                 title=res.json()["title"]["rendered"]
-                                )
-            update_image = {'alt_text': media_data.alt_text, "caption": media_data.caption}
-            requests.post(self.site_media_url + f"/{res.json()['id']}",
-            json=update_image, auth=(self.username, self.app_password))
-            return True, output
-        
-        else:
-            print(res.json())
+        res = self.session.post(self.site_media_url, data=img_data, auth=(self.username, self.app_password), headers=img_header, timeout=self.timeout)
+        return res, False
+
+    def _upload_with_metadata(self, img_data: bytes, media_data: MediaData) -> requests.Response:
+        """uploads the file and sets alt text and caption in the same request"""
+        files = {"file": (media_data.file_name, img_data, media_data.content_type)}
+        return self.session.post(self.site_media_url, files=files, data=media_fields(media_data),
+                                 auth=(self.username, self.app_password), timeout=self.timeout)
+
+    def _created_output(self, res: requests.Response, media_data: MediaData, metadata_sent: bool) -> tuple[bool, MediaOutput | None]:
+        if res.status_code != 201:
+            print(res.status_code, res.text[:500])
+            return False, None
+
+        try:
+            data = res.json()
+            output = created_media_output(data, media_data)
+        except (ValueError, KeyError, TypeError):
+            print(f"{media_data.file_name}: unexpected answer from {self.site_url}: {res.text[:500]}")
             return False, None
+        # some sites accept the upload but drop the extra fields, set them afterwards
+        if not metadata_sent or metadata_dropped(data, media_data):
+            self.session.post(self.site_media_url + f"/{data['id']}", idempotent=True,
+            json=media_fields(media_data), auth=(self.username, self.app_password), timeout=self.timeout)
+        return True, output
+
+    def find_media(self, file_name: str) -> MediaOutput | None:
+        """the media item uploaded from a file of that name, if the site has one"""
+        try:
+            res = self.session.get(self.site_media_url, auth=(self.username, self.app_password), timeout=self.timeout,
+                                   params={"search": Path(file_name).stem, "per_page": 100,
+                                           "_fields": "id,slug,guid,title,alt_text"})
+            items = res.json() if res.status_code == 200 else []
+            for item in items:
+                # a name that was taken already gets -1, -2... appended, those are other uploads
+                if item["guid"]["rendered"].rsplit("/", 1)[-1] == file_name:
+                    return MediaOutput(id=item["id"], slug=item["slug"], link=item["guid"]["rendered"],
+                                       alt_text=item.get("alt_text", ''), title=item["title"]["rendered"])
+        except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+            print(f"{file_name}: could not look up earlier uploads: {e!r}")
+        return None
     
     
     def update_media(self, wp_media_id: str, media_data: MediaData) -> tuple[bool, MediaOutput | None]:
@@ -67,7 +158,8 @@ class WordpressApiMediaCrud:
 
             image_name = os.path.basename(media_data.file_path)
             
-            img_data = open(media_data.file_path, 'rb').read()
+            with open(media_data.file_path, 'rb') as f:
+                img_data = f.read()
             img_header = {
                 'Content-Type': 'image/jpg',
                 'Content-Disposition': 'attachment; filename=%s' % image_name,
@@ -77,9 +169,9 @@ class WordpressApiMediaCrud:
                 'alt_text': media_data.alt_text,
                 'caption': media_data.caption,
             }
-            res = requests.post(f"{self.site_media_url}/{wp_media_id}",
+            res = self.session.post(f"{self.site_media_url}/{wp_media_id}",
                                 json=data, headers=img_header,
-                                auth=(self.username, self.app_password))
+                                auth=(self.username, self.app_password), timeout=self.timeout)
             
             if res.status_code == 200:
                 output = MediaOutput(id=res.json()["id"], 
@@ -101,9 +193,9 @@ class WordpressApiMediaCrud:
 
     def delete_media(self, wp_media_id: str) -> bool:
         try:
-            res = requests.delete(f"{self.site_media_url}/{wp_media_id}", 
+            res = self.session.delete(f"{self.site_media_url}/{wp_media_id}", 
                                   headers=self.headers, auth=(self.username, self.app_password), 
-                                  data=json.dumps({"force": True}))
+                                  data=json.dumps({"force": True}), timeout=self.timeout)
             
             if res.status_code == 200:
                 print("Media deleted successfully.")
@@ -116,14 +208,8 @@ class WordpressApiMediaCrud:
             print(e)
             return False
     
-    def list_media(self) -> list:
-        try:
-            response = requests.get(self.site_media_url, headers=self.headers, auth=(self.username, self.app_password))
-            if response.status_code == 200:
-                return response.json()
-            else:
-                return []
-        except Exception as e:
-            print(e)
-            return []
+    def list_media(self, fields: list[str] | None = None, per_page: int = 100) -> list:
+        """every media item of the site, only the given fields of them if any, raises ListingError if they could not be listed"""
+        return list_collection(self.session, self.site_media_url, (self.username, self.app_password), self.timeout,
+                               fields, per_page, cache=self.listing_cache)
         
\ No newline at end of file
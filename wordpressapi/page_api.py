@@ -2,6 +2,9 @@ from typing import NamedTuple
 import requests
 import traceback
 import json
+from wordpressapi.listing import ListingCache, list_collection
+from wordpressapi.scheduler import ScheduledSession, create_scheduled_session
+from wordpressapi.session import DEFAULT_TIMEOUT
 
 class PageOutput(NamedTuple):
     id: str | None
@@ -20,20 +23,25 @@ class WordpressApiPageCrud:
     headers = {"Content-Type": "application/json; charset=utf-8"}
 
 
-    def __init__(self, site_url: str, username: str, app_password: str) -> None:
+    def __init__(self, site_url: str, username: str, app_password: str,
+                 session: ScheduledSession | None = None, timeout=DEFAULT_TIMEOUT,
+                 listing_cache: ListingCache | None = None) -> None:
         self.site_url = site_url 
         self.page_url_part = "/wp-json/wp/v2/pages"
         
         self.username = username
         self.app_password = app_password
+        self.session = session or create_scheduled_session()
+        self.timeout = timeout
+        self.listing_cache = listing_cache
 
     def test_credentials(self):
         try:
-            res = requests.post(self.site_url + "/wp-json/wp/v2/tags", data=json.dumps({"name": "testing"}), headers=self.headers,
-                                auth=(self.username, self.app_password))
+            res = self.session.post(self.site_url + "/wp-json/wp/v2/tags", data=json.dumps({"name": "testing"}), headers=self.headers,
+                                auth=(self.username, self.app_password), timeout=self.timeout)
             if res.status_code == 201:
-                res = requests.delete(self.site_url + f"/wp-json/wp/v2/tags/{res.json()['id']}", data=json.dumps({"force": True}), headers=self.headers,
-                                      auth=(self.username, self.app_password))
+                res = self.session.delete(self.site_url + f"/wp-json/wp/v2/tags/{res.json()['id']}", data=json.dumps({"force": True}), headers=self.headers,
+                                      auth=(self.username, self.app_password), timeout=self.timeout)
                 return True, ""
             else:
                 return False, f"incorrect credentials for site {self.site_url}"
@@ -42,31 +50,26 @@ class WordpressApiPageCrud:
 
 
     def list_pages(self) -> dict[str, int]:
-        """returns a dictionary with page title as key and its wordpress id """
+        """returns a dictionary with page title as key and its wordpress id, raises ListingError if they could not be listed"""
         pages_data = {}
-        try:
-            response = requests.get(self.site_url + self.page_url_part, headers=WordpressApiPageCrud.headers, 
-                                    auth=(self.username, self.app_password))
-            if response.status_code == 200:
-                results = response.json()
-                if len(results) > 0:
-                    for res in results:
-                        pages_data[res['title']['rendered']] = res['id'] 
-                return pages_data
-            else:
-                return pages_data
-            
-        except requests.RequestException:
-            print(traceback.format_exc())
-            return pages_data
+        results = list_collection(self.session, self.site_url + self.page_url_part, (self.username, self.app_password),
+                                  self.timeout, ["id", "title"], cache=self.listing_cache)
+        for res in results:
+            pages_data[res['title']['rendered']] = res['id']
+        return pages_data
     
-    def get_content(self, page_id: str) -> str:
+    def get_content(self, page_id: str, raw: bool = False) -> str:
+        """rendered html of the page, or with raw the content as stored, which needs the credentials"""
         url = f"{self.site_url + self.page_url_part}/{page_id}"
         try:
-            response = requests.get(url, headers=self.headers)
+            if raw:
+                response = self.session.get(url, headers=self.headers, params={"context": "edit"},
+                                            auth=(self.username, self.app_password), timeout=self.timeout)
+            else:
+                response = self.session.get(url, headers=self.headers, timeout=self.timeout)
             if response.status_code == 200:
                 results = response.json()
-                content = results["content"]["rendered"]
+                content = results["content"]["raw" if raw else "rendered"]
                 return content
             
         except requests.RequestException as e:
@@ -79,7 +82,8 @@ class WordpressApiPageCrud:
                 "content": content
             }
             update_url = f"{self.site_url + self.page_url_part}/{page_id}"
-            response = requests.post(update_url, headers=self.headers, auth=(self.username, self.app_password), json=payload)
+            # setting the content twice leaves the page as setting it once, it can be retried
+            response = self.session.post(update_url, idempotent=True, headers=self.headers, auth=(self.username, self.app_password), json=payload, timeout=self.timeout)
             if response.status_code == 200:
                 return True
             else:
@@ -91,8 +95,8 @@ class WordpressApiPageCrud:
     
     def create_page(self, data: PageData) -> tuple[bool, PageOutput | None]:
         try:    
-            response = requests.post(self.site_url, data=json.dumps(data._asdict()), headers=WordpressApiPageCrud.headers, 
-                                     auth=(self.username, self.app_password))
+            response = self.session.post(self.site_url, data=json.dumps(data._asdict()), headers=WordpressApiPageCrud.headers, 
+                                     auth=(self.username, self.app_password), timeout=self.timeout)
             if response.status_code in(200, 201):
                 return True, PageOutput(id=response.json()["id"], slug=response.json()["slug"], link=response.json()["link"]) 
             else:
@@ -104,8 +108,8 @@ class WordpressApiPageCrud:
         
     def delete_page(self, wp_page_id: str) -> bool:
         try:
-            response = requests.delete(f"{self.site_url}/{wp_page_id}", headers=WordpressApiPageCrud.headers, 
-                                       auth=(self.username, self.app_password))
+            response = self.session.delete(f"{self.site_url}/{wp_page_id}", headers=WordpressApiPageCrud.headers, 
+                                       auth=(self.username, self.app_password), timeout=self.timeout)
             if response.status_code == 200:
                 return True
             else:
@@ -0,0 +1,241 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+import requests
+from wordpressapi.session import create_session
+
+
+# the site refused the request without acting on it, it can be sent again whatever the method
+THROTTLE_STATUSES = (429, 503)
+# failures worth another try, but only for requests that do the same thing when sent twice
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "OPTIONS", "PUT", "DELETE"))
+
+
+def retry_after_seconds(value: str | None) -> float | None:
+    """the Retry-After header in seconds, it is either a number of seconds or an http date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class SiteScheduler:
+    """
+    paces the requests to one site. A token bucket caps the request rate, if
+    one is given, and the number of requests in flight follows AIMD: it grows
+    by about one per round of successful requests and halves when the site
+    answers 429 or 503, at most once per round. A Retry-After on those holds
+    back every request to the site until it has passed. Thread safe, and the
+    same scheduler can pace an asyncio client of the site as well.
+    """
+
+    def __init__(self, max_concurrency: int = 10, min_concurrency: int = 1, rate: float | None = None,
+                 burst: int | None = None, max_retries: int = 4, backoff: float = 0.5, max_backoff: float = 30.0,
+                 seed: int | None = None) -> None:
+        self.lock = threading.Lock()
+        # threads waiting for a free slot wait on the condition, asyncio tasks on a future, release wakes them
+        self.slot_freed = threading.Condition(self.lock)
+        self.async_waiters: deque[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self.max_concurrency = max_concurrency
+        self.concurrency_set = False  # a max_concurrency given for the site is not raised for more workers
+        self.min_concurrency = min_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.rate = rate  # requests per second, None for no cap
+        self.burst = burst or max(1, int(rate or 1))
+        self.tokens = float(self.burst)
+        self.refilled_at = time.monotonic()
+        self.resume_at = 0.0  # nothing is sent before this, set from Retry-After
+        self.decreased_at = 0.0
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.random = random.Random(seed)
+        self.retries = 0
+        self.throttled = 0
+
+    def configure(self, rate: float | None = None, max_concurrency: int | None = None):
+        """changes the rate cap and the most requests in flight, None leaves a setting as it is"""
+        with self.lock:
+            if rate is not None:
+                self.rate = rate or None
+                self.burst = max(1, int(rate or 1))
+                self.tokens = min(self.tokens, float(self.burst))
+            if max_concurrency is not None:
+                self.concurrency_set = True
+                self._set_max_concurrency(max_concurrency)
+
+    def allow_concurrency(self, workers: int):
+        """
+        lets workers requests be in flight when the run uses that many, unless
+        a max_concurrency was set for the site, which stays the cap
+        """
+        with self.lock:
+            if not self.concurrency_set and workers > self.max_concurrency:
+                self._set_max_concurrency(workers)
+
+    def _set_max_concurrency(self, max_concurrency: int):
+        # the current limit moves by as much as the cap, it keeps what it has backed off by
+        self.limit = max(float(self.min_concurrency),
+                         min(float(max_concurrency), self.limit + max_concurrency - self.max_concurrency))
+        self.max_concurrency = max_concurrency
+        self._wake(max(1, int(self.limit)))
+
+    def _take(self) -> tuple[float | None, float]:
+        """
+        with the lock held: (0, start time) with a slot taken, (seconds to wait
+        before trying again, 0), or (None, 0) to wait until a slot is given back
+        """
+        now = time.monotonic()
+        if now < self.resume_at:
+            return self.resume_at - now, 0.0
+        if self.in_flight >= int(self.limit):
+            return None, 0.0
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+            self.refilled_at = now
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate, 0.0
+            self.tokens -= 1
+        self.in_flight += 1
+        return 0.0, now
+
+    def _wake(self, count: int = 1):
+        """with the lock held: wakes count waiting threads and count waiting tasks to try for a slot again"""
+        self.slot_freed.notify(count)
+        for _ in range(min(count, len(self.async_waiters))):
+            loop, waiter = self.async_waiters.popleft()
+            try:
+                loop.call_soon_threadsafe(_set_waiter, waiter)
+            except RuntimeError:
+                pass  # its loop is closed
+
+    def acquire(self) -> float:
+        """waits for a slot, returns when the request started, to be given back to release"""
+        with self.slot_freed:
+            while True:
+                wait, started = self._take()
+                if wait == 0:
+                    return started
+                self.slot_freed.wait(wait)
+
+    async def acquire_async(self) -> float:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.lock:
+                wait, started = self._take()
+                if wait == 0:
+                    return started
+                waiter = loop.create_future()
+                self.async_waiters.append((loop, waiter))
+            try:
+                await asyncio.wait((waiter,), timeout=wait)
+            finally:
+                with self.lock:
+                    if (loop, waiter) in self.async_waiters:
+                        self.async_waiters.remove((loop, waiter))
+
+    def release(self, started: float, status: int | None, retry_after: float | None = None):
+        """gives the slot back and adapts the concurrency to how the site answered"""
+        with self.lock:
+            self.in_flight -= 1
+            slots = int(self.limit)
+            now = time.monotonic()
+            if status in THROTTLE_STATUSES:
+                self.throttled += 1
+                # the requests sent before the last decrease already count towards it
+                if started >= self.decreased_at:
+                    self.limit = max(float(self.min_concurrency), self.limit / 2)
+                    self.decreased_at = now
+                if retry_after:
+                    self.resume_at = max(self.resume_at, now + retry_after)
+            elif status is not None and status < 500:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            # the slot given back, and one more when the limit just grew past a whole number
+            self._wake(1 + max(0, int(self.limit) - slots))
+
+    def should_retry(self, status: int, idempotent: bool, attempt: int) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        return status in THROTTLE_STATUSES or (idempotent and status in RETRY_STATUSES)
+
+    def retry_delay(self, attempt: int, retry_after: float | None = None) -> float:
+        """exponential backoff with full jitter, never shorter than the site asked for"""
+        with self.lock:
+            self.retries += 1
+            jittered = self.random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        return max(retry_after or 0.0, jittered)
+
+
+def _set_waiter(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class ScheduledSession:
+    """
+    a requests.Session stand-in that sends every request through the site's
+    scheduler. Throttled requests are sent again whatever the method, other
+    error statuses only for idempotent ones, a POST counts as one unless told
+    otherwise. Failed connections are left to the session's adapter, which
+    retries them for idempotent methods, and raise as they would without it.
+    """
+
+    def __init__(self, session: requests.Session, scheduler: SiteScheduler) -> None:
+        self.session = session
+        self.scheduler = scheduler
+
+    def request(self, method: str, url: str, idempotent: bool | None = None, **kwargs) -> requests.Response:
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            started = self.scheduler.acquire()
+            status = retry_after = None
+            try:
+                response = self.session.request(method, url, **kwargs)
+                status = response.status_code
+                retry_after = retry_after_seconds(response.headers.get("Retry-After"))
+            finally:
+                self.scheduler.release(started, status, retry_after)
+            if not self.scheduler.should_retry(status, idempotent, attempt):
+                return response
+            delay = self.scheduler.retry_delay(attempt, retry_after)
+            print(f"{method} {url}: {status}, attempt {attempt + 2} in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, idempotent: bool = False, **kwargs) -> requests.Response:
+        return self.request("POST", url, idempotent, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def create_scheduled_session(pool_size: int = 10, max_retries: int = 3, backoff_factor: float = 0.5,
+                             rate: float | None = None, max_concurrency: int | None = None) -> ScheduledSession:
+    """
+    keep-alive session to one site paced by its own scheduler. The adapter
+    only retries failed connections, error statuses are retried by the scheduler.
+    """
+    session = create_session(pool_size, max_retries, backoff_factor, status_forcelist=())
+    scheduler = SiteScheduler(pool_size, rate=rate, max_retries=max_retries + 1, backoff=backoff_factor)
+    if max_concurrency:
+        scheduler.configure(max_concurrency=max_concurrency)
+    return ScheduledSession(session, scheduler)
@@ -0,0 +1,52 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+DEFAULT_TIMEOUT = (10, 120)  # connect, read
+
+
+def create_session(pool_size: int = 10, max_retries: int = 3, backoff_factor: float = 0.5,
+                   status_forcelist: tuple[int, ...] = (500, 502, 503, 504)) -> requests.Session:
+    """
+    keep-alive session whose connections are shared by every request to a site.
+    pool_size is the number of connections kept open per host, it should be at
+    least the number of threads using the session. Only idempotent requests
+    (GET, DELETE...) are retried, a POST is never sent twice by the adapter.
+    An empty status_forcelist leaves retrying error statuses to the caller,
+    the adapter then only retries failed connections.
+    """
+    session = requests.Session()
+    mount_adapter(session, create_adapter(pool_size, max_retries, backoff_factor, status_forcelist))
+    return session
+
+
+def create_adapter(pool_size: int = 10, max_retries: int = 3, backoff_factor: float = 0.5,
+                   status_forcelist: tuple[int, ...] = (500, 502, 503, 504)) -> HTTPAdapter:
+    retry = Retry(total=max_retries, backoff_factor=backoff_factor,
+                  status_forcelist=status_forcelist, respect_retry_after_header=True,
+                  raise_on_status=False)
+    return HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+
+def mount_adapter(session: requests.Session, adapter: HTTPAdapter):
+    """sends the session's http and https requests through adapter, requests in flight finish on the one they used"""
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def connection_stats(session: requests.Session) -> dict[str, int]:
+    """number of connections opened and requests sent through the session's live pools"""
+    stats = {"connections": 0, "requests": 0}
+    adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+    for adapter in adapters.values():
+        if not isinstance(adapter, HTTPAdapter):
+            continue
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats["connections"] += pool.num_connections
+            stats["requests"] += pool.num_requests
+    return stats
@@ -1,15 +1,65 @@
+import csv
+from wordpressapi.listing import ListingCache
 from wordpressapi.media_api import WordpressApiMediaCrud
 from wordpressapi.page_api import WordpressApiPageCrud
+from wordpressapi.scheduler import create_scheduled_session
+from wordpressapi.session import DEFAULT_TIMEOUT, connection_stats, create_adapter, mount_adapter
 
 
 class WpApi:
-    def __init__(self, site_url: str, username: str, app_password: str) -> None:
+    def __init__(self, site_url: str, username: str, app_password: str,
+                 pool_size: int = 10, max_retries: int = 3, backoff_factor: float = 0.5,
+                 timeout=DEFAULT_TIMEOUT, listing_cache_dir: str | None = None,
+                 rate: float | None = None, max_concurrency: int | None = None) -> None:
+        """rate caps the requests per second to the site, max_concurrency the requests in flight to it"""
         self.site_url = site_url 
         self.username = username
         self.app_password = app_password
 
-        self.media = WordpressApiMediaCrud(site_url, username, app_password)
-        self.page = WordpressApiPageCrud(site_url, username, app_password)
+        # one keep-alive pool per site, shared by the media and page clients, and one
+        # scheduler pacing and retrying every request to the site, the async client shares it too
+        scheduled = create_scheduled_session(pool_size, max_retries, backoff_factor, rate, max_concurrency)
+        self.session = scheduled.session
+        self.scheduler = scheduled.scheduler
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.retired_adapters = []  # replaced by a bigger pool, closed with the session
+        # page and media listings are kept on disk and revalidated instead of downloaded again
+        listing_cache = ListingCache(listing_cache_dir) if listing_cache_dir else None
+        self.media = WordpressApiMediaCrud(site_url, username, app_password, scheduled, timeout, listing_cache)
+        self.page = WordpressApiPageCrud(site_url, username, app_password, scheduled, timeout, listing_cache)
+
+    def allow_concurrency(self, workers: int):
+        """room for workers requests in flight at once, in the scheduler and the connection pool"""
+        self.scheduler.allow_concurrency(workers)
+        if workers > self.pool_size:
+            # a new adapter sized for the run, the one it replaces keeps its connections until close
+            self.retired_adapters.append(self.session.adapters["https://"])
+            mount_adapter(self.session, create_adapter(workers, self.max_retries, self.backoff_factor,
+                                                       status_forcelist=()))
+            self.pool_size = workers
+
+    def connection_stats(self) -> dict[str, int]:
+        return connection_stats(self.session)
+
+    def close(self):
+        self.session.close()
+        for adapter in self.retired_adapters:
+            adapter.close()
 
     def __str__(self) -> str:
-        return str(self.page)
\ No newline at end of file
+        return str(self.page)
+
+
+def load_credentials(csv_path: str, listing_cache_dir: str | None = None) -> dict[str, WpApi]:
+    """reads a username,app_password,site_url csv into WpApi instances keyed by site url"""
+    websites_apis = {}
+    with open(csv_path, newline='') as csvfile:
+        creds_reader = csv.reader(csvfile, delimiter=",")
+        for row in list(creds_reader)[1:]:
+            username, password, url = row
+            wp_api = WpApi(username=username, app_password=password, site_url=url,
+                           listing_cache_dir=listing_cache_dir)
+            websites_apis[str(wp_api)] = wp_api
+    return websites_apis
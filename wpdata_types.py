@@ -1,3 +1,4 @@
+import queue
 from enum import Enum
 from typing import NamedTuple
 from wordpressapi.wp_api import WpApi
@@ -13,6 +14,33 @@ class ImageVariance(Enum):
     DifferentImage = "Different Images Same Quote"
     DifferentQuote = "Different Quotes Same Image"
 
+class OutputFormat(Enum):
+    PNG = "PNG"
+    JPEG = "JPEG"
+    WebP = "WebP"
+    AVIF = "AVIF"
+
+class OutputFiles(Enum):
+    Sync = "Write Then Upload"  # uploads read the composite back from the output folder
+    Background = "Write In Background"  # uploaded from memory, written while uploading
+    Off = "Upload Only"  # uploaded from memory, nothing is written
+
+class PreprocessEngine(Enum):
+    Pillow = "Pillow"
+    NumPy = "NumPy"  # needs numpy, darkens and watermarks in one array, the same pixels as Pillow
+
+class ProgressKind(Enum):
+    Started = "started"  # count is the number of composites the run will make
+    Rendered = "rendered"
+    Uploaded = "uploaded"
+    Failed = "failed"
+    PageUpdated = "page updated"
+
+class ContentMode(Enum):
+    Append = "Append Every Run"  # unmarked, the page grows with every run
+    Replace = "Replace Previous Run"  # the uploader's marked block is replaced
+    AppendOwned = "Append To Previous Runs"  # added to the end of the marked block
+
 
 class ScraperBotInput(NamedTuple):
     wp_page_id: str
@@ -32,6 +60,37 @@ class ScraperBotInput(NamedTuple):
     font_file: str | None = None
     font_size: int | None = None
     logo_size: tuple[int, int] | None = None
+    upload_workers: int | None = None
+    render_workers: int | None = None
+    max_pending: int | None = None
+    async_uploads: int | None = None
+    cache_dir: str | None = None
+    cache_max_bytes: int | None = None
+    memory_budget_mb: int | None = None
+    journal_path: str | None = None
+    dedup_index_path: str | None = None
+    dedup_rebuild: bool = False
+    dedup_max_age_hours: float | None = None
+    content_mode: ContentMode = ContentMode.Append
+    template_file: str | None = None
+    name_seed: int | None = None
+    avoid_existing_names: bool = False
+    output_format: OutputFormat = OutputFormat.PNG
+    output_quality: int | None = None
+    output_max_kb: int | None = None
+    output_files: OutputFiles = OutputFiles.Sync
+    preprocess_engine: PreprocessEngine = PreprocessEngine.Pillow
+    progress: queue.SimpleQueue | None = None
+    metrics_path: str | None = None
+    prometheus_path: str | None = None
+    profile_path: str | None = None
+    trace_memory: bool = False
+
+class SiteTarget(NamedTuple):
+    wpapi: WpApi
+    wp_page_id: str
+    element_id: str | None = None  # defaults to the element id of the job
+    upload_workers: int = 4
 
 class GuiTags(Enum):
     Popup_Msg_TagId = 'info_popup'
@@ -42,7 +101,14 @@ class GuiTags(Enum):
     Change_Credentials_Button = "Change_Credentials_Button"
     Create_Page_Button = "Create_Page_Button"
     Image_Variance_Tag = "Image_Variance_Tag"
+    Content_Mode_Tag = "Content_Mode_Tag"
+    Output_Format_Tag = "Output_Format_Tag"
+    Output_Files_Tag = "Output_Files_Tag"
+    Preprocess_Engine_Tag = "Preprocess_Engine_Tag"
     Image_Count_Name = "Image_Count_Name"
+    Upload_Workers_Id = "upload_workers"
+    Progress_Bar_Tag = "Progress_Bar_Tag"
+    Progress_Text_Tag = "Progress_Text_Tag"
 
     Image_Folder_Dialog_Id = "image_folder_dialog_id"
     Output_Folder_Dialog_Id = "output_folder_dialog_id"